@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import os
+import random
+import sys
+import time
+import numpy as np
+import matplotlib.path as mplPath
+from art_msgs.msg import ObjInstance, InstancesArray
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from art_brain.object_index import ArtObjectIndex  # noqa
+
+# compares linear scans of InstancesArray with ArtObjectIndex queries (id, polygon, place clearance)
+
+
+def measure(fn, cnt):
+
+    start = time.time()
+
+    for i in range(0, cnt):
+        fn()
+
+    return (time.time() - start) / cnt * 1000000.0
+
+
+def generate(n):
+
+    objects = InstancesArray()
+    objects.header.frame_id = "marker"
+
+    for i in range(0, n):
+
+        obj = ObjInstance()
+        obj.object_id = "obj_" + str(i)
+        obj.object_type = random.choice(["profile_20_60", "profile_20_80", "box"])
+        obj.pose.position.x = random.uniform(0, 1.5)
+        obj.pose.position.y = random.uniform(0, 0.7)
+        objects.instances.append(obj)
+
+    return objects
+
+
+def linear_id(objects, object_id):
+
+    for obj in objects.instances:
+        if obj.object_id == object_id:
+            return obj
+
+
+def linear_polygon(objects, pol):
+
+    for obj in objects.instances:
+        if pol.contains_point([obj.pose.position.x, obj.pose.position.y]):
+            return obj
+
+
+def linear_radius(objects, x, y, r):
+
+    return [obj for obj in objects.instances if np.hypot(obj.pose.position.x - x, obj.pose.position.y - y) < r]
+
+
+def main(args):
+
+    cnt = 1000
+
+    if len(args) > 1:
+        cnt = int(args[1])
+
+    # small polygon in the corner of the table
+    pol = mplPath.Path(np.array([[1.3, 0.5], [1.5, 0.5], [1.5, 0.7], [1.3, 0.7]]), closed=True)
+
+    for n in [10, 100, 1000]:
+
+        objects = generate(n)
+        index = ArtObjectIndex(objects)
+        last_id = objects.instances[-1].object_id
+
+        print "Objects: " + str(n)
+        print "  build index: %.1f us" % measure(lambda: ArtObjectIndex(objects), 10)
+        print "  id: linear %.1f us, index %.1f us" % (measure(lambda: linear_id(objects, last_id), cnt),
+                                                       measure(lambda: index.get(last_id), cnt))
+        print "  polygon: linear %.1f us, index %.1f us" % (measure(lambda: linear_polygon(objects, pol), cnt),
+                                                            measure(lambda: index.in_polygon(pol), cnt))
+        print "  radius: linear %.1f us, index %.1f us" % (measure(lambda: linear_radius(objects, 0.7, 0.3, 0.15), cnt),
+                                                           measure(lambda: index.in_radius(0.7, 0.3, 0.15), cnt))
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv)
+    except KeyboardInterrupt:
+        print("Shutting down")
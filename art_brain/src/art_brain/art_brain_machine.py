@@ -80,6 +80,7 @@ class ArtBrainMachine(object):
     ERROR_NOT_EXECUTING_PROGRAM = 1
     ERROR_NO_INSTRUCTION = 2
     ERROR_NO_PROGRAM_HELPER = 3
+    ERROR_USER_WAIT_TIMEOUT = 4
 
     ERROR_OBJECT_MISSING = 100
     ERROR_OBJECT_MISSING_IN_POLYGON = 101
@@ -1,9 +1,9 @@
-import matplotlib.path as mplPath
 import numpy as np
 import rospy
 import actionlib
-from art_msgs.msg import pickplaceAction, ObjInstance
-import copy
+from art_msgs.msg import pickplaceAction, pickplaceGoal, ObjInstance
+import threading
+import time
 from std_srvs.srv import Empty, Trigger
 from geometry_msgs.msg import Pose
 
@@ -11,63 +11,68 @@ from geometry_msgs.msg import Pose
 class ArtBrainUtils(object):
 
     @staticmethod
-    def get_pick_obj(instruction, objects):
-        for obj in objects:
-            if obj.object_id == instruction.object:
-                obj_ret = copy.deepcopy(obj)
-                return obj_ret
-        else:
+    def get_instruction_object(instruction):
+        """Returns the first object (id or type) of the instruction or None if it's not set."""
+
+        if len(instruction.object) == 0:
             return None
 
+        return instruction.object[0]
+
+    @staticmethod
+    def get_pick_obj(instruction, index, exclude=()):
+        """exclude - ids of objects which can't be selected (e.g. already being picked)."""
+
+        object_id = ArtBrainUtils.get_instruction_object(instruction)
+
+        if object_id is None:
+            return None
+
+        obj = index.get(object_id)
+
+        if obj is None or obj.object_id in exclude:
+            return None
+
+        return obj
+
     @staticmethod
     def get_pick_obj_from_feeder(instruction):
         obj = ObjInstance()
         obj.object_id = None
-        obj.object_type = instruction.object
+        obj.object_type = ArtBrainUtils.get_instruction_object(instruction)
         obj.pose = Pose()
         return obj
 
     @staticmethod
-    def get_pick_obj_from_polygon(instruction, objects):
-        pick_polygon = []
-        pol = None
-        obj_ret = None
+    def get_pick_obj_from_polygon(instruction, index, pol, exclude=()):
+        """pol is the compiled polygon of the instruction (see ProgramHelper.get_polygon).
 
-        # TODO check frame_id and transform to table frame?
-        for point in instruction.pick_polygon.polygon.points:
-            pick_polygon.append([point.x, point.y])
-        pick_polygon.append([0, 0])
-
-        if len(pick_polygon) > 0:
-            pol = mplPath.Path(np.array(pick_polygon), closed=True)
+        exclude - ids of objects which can't be selected (e.g. already being picked).
+        """
 
-        # shuffle the array to not get the same object each time
-        # random.shuffle(self.objects.instances)
-
-        for obj in objects.instances:
+        # TODO check frame_id and transform to table frame?
+        if pol is None:
 
-            if pol is None:
+            # if no pick polygon is specified - let's take the first
+            # object of that type
+            object_type = ArtBrainUtils.get_instruction_object(instruction)
+            objs = index.get_by_type(object_type) if object_type is not None else []
 
-                # if no pick polygon is specified - let's take the first
-                # object of that type
-                if obj.object_type == instruction.object:
-                    obj_ret = copy.deepcopy(obj)
-                    break
+        else:
 
-            else:
+            # test if some object is in polygon and take the first one
+            objs = index.in_polygon(pol)
 
-                # test if some object is in polygon and take the first one
-                if pol.contains_point([obj.pose.position.x, obj.pose.position.y]):
-                    obj_ret = copy.deepcopy(obj)
-                    print('Selected object: ' + obj.object_id)
-                    break
+        objs = [obj for obj in objs if obj.object_id not in exclude]
 
-        else:
+        if len(objs) == 0:
             if pol is not None:
                 print('No object in the specified polygon')
                 print pol
             return None
-        return obj_ret
+
+        print('Selected object: ' + objs[0].object_id)
+        return objs[0]
 
     @staticmethod
     def get_place_pose(instruction):
@@ -83,6 +88,27 @@ class ArtBrainUtils(object):
             return None
         return pose
 
+    @staticmethod
+    def scene_changed(old, new, threshold):
+        """Returns True if objects were added / removed or some of them moved more than threshold (in x or y)."""
+
+        if len(old.instances) != len(new.instances):
+            return True
+
+        positions = {o.object_id: o.pose.position for o in old.instances}
+
+        for obj in new.instances:
+
+            pos = positions.get(obj.object_id)
+
+            if pos is None:
+                return True
+
+            if abs(pos.x - obj.pose.position.x) > threshold or abs(pos.y - obj.pose.position.y) > threshold:
+                return True
+
+        return False
+
     @staticmethod
     def distance_2d(pose1, pose2):
         a = np.array((pose1.position.x, pose1.position.y))
@@ -111,6 +137,188 @@ class ArtGripper(object):
             "/art/pr2/" + name + "/get_ready", Trigger)
         self.move_to_user_client = rospy.ServiceProxy(
             "/art/pr2/" + name + "/move_to_user", Trigger)
+        self.pending_goal = None  # ArtPickPlaceGoal sent by ArtPickPlaceExecutor
+        self.pick_item = None  # (block id, item id) of the pick which put holding_object into the gripper
+
+
+class ArtPreparedInstruction(object):
+
+    """Instruction resolved in advance (selected object, gripper, place feasibility) for given version of the scene."""
+
+    def __init__(self, block_id, item_id, scene_version):
+
+        self.block_id = block_id
+        self.item_id = item_id
+        self.scene_version = scene_version
+
+        self.obj = None
+        self.gripper = None
+        self.place_ok = None
+
+        self.ready = threading.Event()
+
+
+class ArtPickPlaceGoal(object):
+
+    def __init__(self, operation, obj=None, done_cb=None, item=None):
+
+        self.operation = operation
+        self.obj = obj
+        self.done_cb = done_cb
+        self.item = item  # (block id, item id) of the instruction which sent the goal
+        self.done = False
+        self.success = None
+
+
+class ArtPickPlaceExecutor(object):
+
+    """ArtPickPlaceExecutor sends pick/place goals without waiting for their results.
+
+        Each gripper has at most one outstanding goal. Results are taken in actionlib done callback, which calls
+        done_cb of the goal and wakes up waiters through ArtBrainEvents. A goal has to be waited for before
+        an instruction which depends on it, its failure is then reported against the instruction which sent it
+        (see item). Goals on different grippers run concurrently.
+
+        Sending a pick marks the object as held by the gripper (so it can't be selected again), cancel_all() clears
+        this mark for picks which did not succeed.
+
+    """
+
+    def __init__(self, events, grippers):
+
+        self.events = events
+        self.grippers = [g for g in grippers if g is not None]
+
+    def send(self, gripper, goal, obj=None, done_cb=None, item=None):
+
+        pending = ArtPickPlaceGoal(goal.operation, obj, done_cb, item)
+        gripper.pending_goal = pending
+
+        if goal.operation == pickplaceGoal.PICK:
+
+            gripper.holding_object = obj
+            gripper.pick_item = item
+
+        gripper.pp_client.send_goal(goal, done_cb=lambda state, result: self._done(pending, state, result))
+        return pending
+
+    def _done(self, pending, state, result):
+
+        pending.success = result is not None and result.result == 0
+
+        if pending.done_cb is not None:
+            pending.done_cb(pending)
+
+        pending.done = True
+        self.events.notify()
+
+    def wait(self, gripper, timeout=None):
+        """Waits for outstanding goal of the gripper and returns it (None if there is no such goal).
+
+        Returned goal is not done if waiting was cancelled or timed out.
+        """
+
+        pending = gripper.pending_goal
+
+        if pending is None:
+            return None
+
+        if self.events.wait_for(lambda: pending.done, timeout):
+            gripper.pending_goal = None
+
+        return pending
+
+    def cancel_all(self):
+
+        for gripper in self.grippers:
+
+            pending = gripper.pending_goal
+
+            if pending is not None:
+
+                if not pending.done:
+                    gripper.pp_client.cancel_all_goals()
+
+                # cancelled or failed pick - the gripper is not holding the object
+                if pending.operation == pickplaceGoal.PICK and not pending.success and gripper.holding_object is pending.obj:
+
+                    gripper.holding_object = None
+                    gripper.pick_item = None
+
+                gripper.pending_goal = None
+
+
+class ArtBrainEvents(object):
+
+    """ArtBrainEvents lets brain states wait for changes of its state (e.g. user activity) without polling.
+
+        Callbacks change the state and then call notify(), waiters block in wait_for(predicate) until the predicate holds.
+        The predicate is evaluated under the lock, so a change can't be missed between the check and the wait.
+        cancel() wakes up all current waiters (wait_for returns False), shutdown() does the same for all future ones.
+
+        Timeouts are implemented by a timer calling notify() (Condition.wait with timeout does polling in Python 2).
+
+    """
+
+    def __init__(self):
+
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._shutdown = False
+
+    def notify(self):
+
+        with self._cond:
+            self._cond.notify_all()
+
+    def cancel(self):
+
+        with self._cond:
+
+            self._generation += 1
+            self._cond.notify_all()
+
+    def shutdown(self):
+
+        with self._cond:
+
+            self._shutdown = True
+            self._cond.notify_all()
+
+    def wait_for(self, predicate, timeout=None):
+        """Returns True once predicate() is True, False on timeout (seconds), cancel or shutdown."""
+
+        timer = None
+
+        with self._cond:
+
+            generation = self._generation
+
+            if timeout is not None:
+
+                deadline = time.time() + timeout
+                timer = threading.Timer(timeout, self.notify)
+                timer.daemon = True
+                timer.start()
+
+            try:
+
+                while not predicate():
+
+                    if self._shutdown or self._generation != generation:
+                        return False
+
+                    if timeout is not None and time.time() >= deadline:
+                        return False
+
+                    self._cond.wait()
+
+                return True
+
+            finally:
+
+                if timer is not None:
+                    timer.cancel()
 
 
 class ErrorMsgs(object):
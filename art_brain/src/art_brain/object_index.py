@@ -0,0 +1,102 @@
+import math
+import numpy as np
+
+
+class ArtObjectIndex(object):
+
+    """ArtObjectIndex is a read-only index of objects from one InstancesArray message.
+
+        Objects can be found by id, by type and by position (2D grid on table coordinates, cell_size in meters).
+        A new index is built for each message, so it can be shared between threads without locking.
+
+    """
+
+    def __init__(self, objects=None, cell_size=0.1):
+
+        self.header = None
+        self.cell_size = cell_size
+
+        self._by_id = {}
+        self._by_type = {}
+        self._grid = {}  # (cell x, cell y) -> list of objects
+        self._order = {}  # id(object) -> index in the message
+
+        if objects is None:
+            return
+
+        self.header = objects.header
+
+        for (i, obj) in enumerate(objects.instances):
+
+            self._order[id(obj)] = i
+            self._by_id[obj.object_id] = obj
+            self._by_type.setdefault(obj.object_type, []).append(obj)
+            self._grid.setdefault(self._cell(obj.pose.position.x, obj.pose.position.y), []).append(obj)
+
+    def _cell(self, x, y):
+
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    def _cells(self, min_x, min_y, max_x, max_y):
+
+        (x1, y1) = self._cell(min_x, min_y)
+        (x2, y2) = self._cell(max_x, max_y)
+
+        # for big areas it is cheaper to go through non-empty cells only
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > len(self._grid):
+
+            for (cell, objs) in self._grid.iteritems():
+                if x1 <= cell[0] <= x2 and y1 <= cell[1] <= y2:
+                    for obj in objs:
+                        yield obj
+            return
+
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                for obj in self._grid.get((cx, cy), []):
+                    yield obj
+
+    def __len__(self):
+
+        return len(self._by_id)
+
+    def get(self, object_id):
+
+        return self._by_id.get(object_id)
+
+    def get_by_type(self, object_type):
+
+        return list(self._by_type.get(object_type, []))
+
+    def get_types(self):
+
+        return self._by_type.keys()
+
+    def in_polygon(self, path, object_type=None):
+        """Returns objects (optionally of given type) inside matplotlib Path, in order of the message."""
+
+        ext = path.get_extents()
+        candidates = [obj for obj in self._cells(ext.x0, ext.y0, ext.x1, ext.y1) if object_type is None or obj.object_type == object_type]
+
+        if len(candidates) == 0:
+            return []
+
+        inside = path.contains_points(np.array([[obj.pose.position.x, obj.pose.position.y] for obj in candidates]))
+        return sorted([obj for (obj, ins) in zip(candidates, inside) if ins], key=lambda obj: self._order[id(obj)])
+
+    def in_radius(self, x, y, radius, object_type=None):
+        """Returns list of (distance, object) of objects closer than radius to (x, y)."""
+
+        ret = []
+
+        for obj in self._cells(x - radius, y - radius, x + radius, y + radius):
+
+            if object_type is not None and obj.object_type != object_type:
+                continue
+
+            d = math.hypot(obj.pose.position.x - x, obj.pose.position.y - y)
+
+            if d < radius:
+                ret.append((d, obj))
+
+        return ret
@@ -4,6 +4,7 @@
 import rospy
 import time
 import copy
+import threading
 
 import actionlib
 from art_msgs.msg import LocalizeAgainstUMFAction, LocalizeAgainstUMFGoal, LocalizeAgainstUMFResult
@@ -15,11 +16,10 @@ from std_msgs.msg import String, Bool
 from art_msgs.msg import pickplaceAction, pickplaceGoal, SystemState, ObjInstance, InstancesArray, ProgramItem, \
     ObjectType, LearningRequestAction, LearningRequestGoal, LearningRequestResult
 from shape_msgs.msg import SolidPrimitive
-from art_msgs.srv import getObjectType
 import matplotlib.path as mplPath
 import numpy as np
 import random
-from art_utils import InterfaceStateManager,  ArtApiHelper,  ProgramHelper
+from art_utils import InterfaceStateManager,  ArtApiHelper,  ProgramHelper, ProgramAnalyzer
 
 from tf import TransformerROS, TransformListener
 
@@ -27,8 +27,9 @@ from tf import TransformerROS, TransformListener
 import logging
 from transitions import logger
 
-from art_brain.brain_utils import ArtBrainUtils, ArtGripper
+from art_brain.brain_utils import ArtBrainUtils, ArtGripper, ArtBrainEvents, ArtPickPlaceExecutor, ArtPreparedInstruction
 from art_brain.art_brain_machine import ArtBrainMachine
+from art_brain.object_index import ArtObjectIndex
 
 
 # TODO:
@@ -80,6 +81,7 @@ class ArtBrain(object):
         self.block_id = None
         self.user_id = 0
         self.objects = InstancesArray()
+        self.object_index = ArtObjectIndex()
         self.executing_program = False
         self.learning = False
         self.instruction = None
@@ -91,6 +93,17 @@ class ArtBrain(object):
         self.table_calibrating = False
         self.cells_calibrated = False
         self.system_calibrated = False
+        self.user_activity = None
+
+        # increased whenever objects on the table differ from the ones used for preparation of look-ahead instruction,
+        # prepared instruction is valid only for its version
+        self.scene_version = 0
+        self.scene_reference = None  # objects (InstancesArray) at the time the instruction was prepared
+        self.prepared = None
+
+        # wakes up waiting states when something changes (user activity, calibration)
+        self.events = ArtBrainEvents()
+        rospy.on_shutdown(self.events.shutdown)
 
         self.learning_block_id = None
         self.learning_item_id = None
@@ -110,6 +123,10 @@ class ArtBrain(object):
 
         self.calibrate_pr2 = rospy.get_param('calibrate_pr2', False)
         self.calibrate_table = rospy.get_param('calibrate_table', False)
+        self.user_wait_timeout = rospy.get_param('user_wait_timeout', 0.0)  # 0 means wait forever
+        self.scene_change_threshold = rospy.get_param('scene_change_threshold', 0.01)
+        self.object_index_cell_size = rospy.get_param('object_index_cell_size', 0.1)
+        self.prepare_timeout = rospy.get_param('prepare_timeout', 5.0)  # max. wait for a prepared instruction
 
         self.user_status_sub = rospy.Subscriber(
             "/art/user/status", UserStatus, self.user_status_cb)
@@ -144,7 +161,7 @@ class ArtBrain(object):
         self.state_manager.set_system_state(
             InterfaceState.STATE_INITIALIZING)
 
-        self.art = ArtApiHelper(brain=True)
+        self.art = ArtApiHelper(brain=True, persistent=True)
         self.ph = ProgramHelper()
 
         self.objects_sub = rospy.Subscriber(
@@ -177,10 +194,10 @@ class ArtBrain(object):
         else:
             self.right_gripper = None
 
-        self.art.wait_for_api()
+        # pick/place goals are sent asynchronously, each gripper may run its own goal
+        self.executor = ArtPickPlaceExecutor(self.events, [self.left_gripper, self.right_gripper])
 
-        self.get_obj_type_srv_client = rospy.ServiceProxy(
-            '/art/db/object_type/get', getObjectType)
+        self.art.wait_for_api()
 
         if not self.table_calibrated:
             rospy.loginfo(
@@ -191,22 +208,23 @@ class ArtBrain(object):
             self.calibrate_table_srv_client = rospy.ServiceProxy(
                 '/art/interface/touchtable/calibrate', Empty)
             attempt = 1
-            rospy.sleep(1)
+            # give latched calibration state a chance to arrive
+            self.events.wait_for(lambda: self.table_calibrated, 1.0)
             while not self.table_calibrated:
+                if rospy.is_shutdown():
+                    return
                 rospy.loginfo(
                     "Trying to calibrate table, attempt " + str(attempt))
                 self.calibrate_table_srv_client.call()
-                rospy.sleep(1)
                 attempt += 1
-                while not self.table_calibrated and self.table_calibrating:
-                    rospy.sleep(1)
+                # wait until calibration starts (retry if it does not) and then until it ends
+                self.events.wait_for(lambda: self.table_calibrated or self.table_calibrating, 1.0)
+                self.events.wait_for(lambda: self.table_calibrated or not self.table_calibrating)
 
-        r = rospy.Rate(1)
-        while not self.is_everything_calibrated():
-            if rospy.is_shutdown():
-                return
+        if not self.is_everything_calibrated():
             rospy.loginfo("Waiting for calibration")
-            r.sleep()
+            if not self.events.wait_for(self.is_everything_calibrated):
+                return
 
         self.fsm.init()
 
@@ -239,6 +257,7 @@ class ArtBrain(object):
         self.instruction = self.ph.get_item_msg(self.block_id, item_id)
 
         self.executing_program = True
+        self.prepared = None
 
         self.state_manager.set_system_state(
             InterfaceState.STATE_PROGRAM_RUNNING)
@@ -279,25 +298,33 @@ class ArtBrain(object):
 
     def state_pick_from_polygon(self, event):
         rospy.loginfo('state_pick_from_polygon')
-        obj = ArtBrainUtils.get_pick_obj_from_polygon(
-            self.instruction, self.objects)
+        prepared = self.get_prepared_instruction()
+        busy = self.get_busy_object_ids()
+        if prepared is not None and prepared.obj is not None and prepared.obj.object_id not in busy:
+            obj = prepared.obj
+        else:
+            obj = ArtBrainUtils.get_pick_obj_from_polygon(
+                self.instruction, self.object_index, self.ph.get_polygon(self.block_id, self.instruction.id), busy)
         if obj is None or obj.object_id is None:
             self.fsm.error(severity=ArtBrainMachine.WARNING,
                            error=ArtBrainMachine.ERROR_OBJECT_MISSING_IN_POLYGON)
             return
         self.state_manager.update_program_item(self.ph.get_program_id(), self.block_id, self.instruction,
                                                {"SELECTED_OBJECT_ID": obj.object_id})
-        gripper = self.get_gripper(obj=obj)
+        if prepared is not None and prepared.gripper is not None and prepared.obj is obj:
+            gripper = prepared.gripper
+        else:
+            gripper = self.get_gripper(obj=obj)
+        if gripper is not None and not self.wait_for_gripper(gripper):
+            return
         if not self.check_gripper_for_pick(gripper):
             return
 
-        if self.pick_object(obj, gripper.pp_client, self.instruction.pick_pose):
-            gripper.holding_object = obj
-            self.fsm.done(success=True)
-
-        else:
-            self.fsm.error(severity=ArtBrainMachine.WARNING,
-                           error=ArtBrainMachine.ERROR_PICK_FAILED)
+        self.pick_object(obj, gripper, self.instruction.pick_pose)
+        self.prepare_next_instruction()
+        if not self.can_overlap(obj) and not self.wait_for_gripper(gripper):
+            return
+        self.fsm.done(success=True)
 
     def state_pick_from_feeder(self, event):
         rospy.loginfo('state_pick_from_feeder')
@@ -314,40 +341,49 @@ class ArtBrain(object):
                            error=ArtBrainMachine.ERROR_PICK_POSE_NOT_SELECTED)
             return
         gripper = self.get_gripper(pick_pose=self.instruction.pick_pose)
+        if gripper is not None and not self.wait_for_gripper(gripper):
+            return
         if not self.check_gripper_for_pick(gripper):
             return
 
         # TODO: pick from feeder method
-        if self.pick_object(obj, gripper.pp_client, self.instruction.pick_pose):
-            gripper.holding_object = obj
-            self.done(success=True)
-
-        else:
-            self.done(success=False)
+        self.pick_object(obj, gripper, self.instruction.pick_pose)
+        if not self.wait_for_gripper(gripper):
+            return
+        self.fsm.done(success=True)
 
     def state_pick_object_id(self, event):
         rospy.loginfo('state_pick_object_id')
-        obj = ArtBrainUtils.get_pick_obj(self.instruction, self.objects)
+        prepared = self.get_prepared_instruction()
+        busy = self.get_busy_object_ids()
+        if prepared is not None and prepared.obj is not None and prepared.obj.object_id not in busy:
+            obj = prepared.obj
+        else:
+            obj = ArtBrainUtils.get_pick_obj(self.instruction, self.object_index, busy)
         if obj is None or obj.object_id is None:
             self.fsm.error(severity=ArtBrainMachine.WARNING,
                            error=ArtBrainMachine.ERROR_OBJECT_MISSING)
             return
         self.state_manager.update_program_item(self.ph.get_program_id(), self.block_id, self.instruction,
                                                {"SELECTED_OBJECT_ID": obj.object_id})
-        gripper = self.get_gripper(obj=obj)
+        if prepared is not None and prepared.gripper is not None and prepared.obj is obj:
+            gripper = prepared.gripper
+        else:
+            gripper = self.get_gripper(obj=obj)
+        if gripper is not None and not self.wait_for_gripper(gripper):
+            return
         if not self.check_gripper_for_pick(gripper):
             return
 
-        if self.pick_object(obj, gripper.pp_client, self.instruction.pick_pose):
-            gripper.holding_object = obj
-            self.fsm.done()
-
-        else:
-            self.fsm.error(severity=ArtBrainMachine.WARNING,
-                           error=ArtBrainMachine.ERROR_PICK_FAILED)
+        self.pick_object(obj, gripper, self.instruction.pick_pose)
+        self.prepare_next_instruction()
+        if not self.can_overlap(obj) and not self.wait_for_gripper(gripper):
+            return
+        self.fsm.done()
 
     def state_place_to_pose(self, event):
         rospy.loginfo('state_place_to_pose')
+        prepared = self.get_prepared_instruction()
         pose = ArtBrainUtils.get_place_pose(self.instruction)
         self.state_manager.update_program_item(
             self.ph.get_program_id(), self.block_id, self.instruction)
@@ -358,16 +394,25 @@ class ArtBrain(object):
                            error=ArtBrainMachine.ERROR_PLACE_POSE_NOT_DEFINED)
             return
         else:
-            gripper = self.get_gripper_holding_object(self.instruction.object)
-            self.check_gripper_for_place(gripper)
+            gripper = self.get_gripper_for_place(self.block_id, self.instruction)
+            # pick might be still running
+            if gripper is not None and not self.wait_for_gripper(gripper):
+                return
+            if not self.check_gripper_for_place(gripper):
+                return
             if gripper.holding_object is None:
                 rospy.logerr("Robot is not holding selected object")
                 self.fsm.error(severity=ArtBrainMachine.WARNING,
                                error=ArtBrainMachine.ERROR_GRIPPER_NOT_HOLDING_SELECTED_OBJECT)
                 return
 
-            if self.place_object(gripper.holding_object, pose, gripper.pp_client):
-                gripper.holding_object = None
+            obj = gripper.holding_object
+            place_checked = prepared is not None and prepared.place_ok and prepared.obj is obj
+
+            if self.place_object(obj, pose, gripper, place_checked):
+                self.prepare_next_instruction()
+                if not self.can_overlap(obj) and not self.wait_for_gripper(gripper):
+                    return
                 self.fsm.done(success=True)
                 return
             else:
@@ -381,10 +426,8 @@ class ArtBrain(object):
         self.state_manager.update_program_item(
             self.ph.get_program_id(), self.block_id, self.instruction)
 
-        rate = rospy.Rate(10)
-
-        while self.user_activity != UserActivity.READY:
-            rate.sleep()
+        if not self.wait_for_user_activity(UserActivity.READY):
+            return
 
         self.fsm.done(success=True)
 
@@ -394,17 +437,36 @@ class ArtBrain(object):
         self.state_manager.update_program_item(
             self.ph.get_program_id(), self.block_id, self.instruction)
 
-        rate = rospy.Rate(10)
-
-        while self.user_activity != UserActivity.WORKING:
-            rate.sleep()
+        if not self.wait_for_user_activity(UserActivity.WORKING):
+            return
 
         self.fsm.done(success=True)
 
+    def wait_for_user_activity(self, activity):
+
+        timeout = self.user_wait_timeout if self.user_wait_timeout > 0 else None
+
+        # user might take a while - prepare what comes next
+        self.prepare_next_instruction()
+
+        if self.events.wait_for(lambda: self.user_activity == activity or not self.executing_program, timeout) \
+                and self.executing_program:
+            return True
+
+        if not self.executing_program:
+            self.fsm.error(severity=ArtBrainMachine.ERROR,
+                           error=ArtBrainMachine.ERROR_NOT_EXECUTING_PROGRAM)
+        else:
+            self.fsm.error(severity=ArtBrainMachine.ERROR,
+                           error=ArtBrainMachine.ERROR_USER_WAIT_TIMEOUT)
+        return False
+
     def state_get_ready(self, event):
         rospy.loginfo('state_get_ready')
         self.state_manager.update_program_item(
             self.ph.get_program_id(), self.block_id, self.instruction)
+        if not self.wait_for_grippers():
+            return
         # TODO: call some service to set PR2 to ready position
         self.right_gripper.get_ready_client.call()
         self.left_gripper.get_ready_client.call()
@@ -413,13 +475,19 @@ class ArtBrain(object):
     def state_program_load_instruction(self, event):
         rospy.loginfo('state_program_load_instruction')
 
-        (self.block_id, item_id) = self.ph.get_id_on_success(
+        (block_id, item_id) = self.ph.get_id_on_success(
             self.block_id, self.instruction.id)
 
-        if self.block_id == 0:
+        if block_id == 0:
+            # all arms have to finish their goals before the program ends
+            if not self.wait_for_grippers():
+                return
+            self.block_id = block_id
             self.fsm.finished()
             return
 
+        self.block_id = block_id
+
         self.instruction = self.ph.get_item_msg(self.block_id, item_id)
 
         if self.instruction is None:
@@ -442,10 +510,12 @@ class ArtBrain(object):
         error = event.kwargs.get('error', None)
         if severity == ArtBrainMachine.SEVERE:
             # handle
+            self.executor.cancel_all()
             self.fsm.program_error_shutdown()
             return
             pass
         elif severity == ArtBrainMachine.ERROR:
+            self.executor.cancel_all()
             self.fsm.program_error_fatal()
             return
             pass
@@ -551,32 +621,27 @@ class ArtBrain(object):
     #                                     MANIPULATION
     # ***************************************************************************************
 
-    def pick_object(self, obj, pp_client, pick_pose=None):
+    def pick_object(self, obj, gripper, pick_pose=None):
 
         goal = pickplaceGoal()
         goal.id = obj.object_id
         goal.operation = goal.PICK
         goal.keep_orientation = False
         rospy.loginfo("Picking object with ID: " + str(obj.object_id))
-        pp_client.send_goal(goal)
-        pp_client.wait_for_result()
-        # TODO: make some error msg etc
-        rospy.loginfo('got result')
-        print(pp_client.get_result())
-        print("status: " + pp_client.get_goal_status_text())
-        print("state: " + str(pp_client.get_state()))
-
-        if pp_client.get_result().result == 0:
-            return True
-        else:
-            return False
 
-    def place_object(self, obj, place, pp_client):
+        def done_cb(pending):
+            # holding_object is cleared when the failure is reported (see wait_for_gripper)
+            rospy.loginfo("Pick of object with ID: " + str(obj.object_id) + " done, success: " + str(pending.success))
+
+        # marks the object as held by the gripper
+        self.executor.send(gripper, goal, obj, done_cb, (self.block_id, self.instruction.id))
+
+    def place_object(self, obj, place, gripper, place_checked=False):
 
         goal = pickplaceGoal()
         goal.operation = goal.PLACE
         goal.id = obj.object_id
-        if not self.check_place_pose(place, obj):
+        if not place_checked and not self.check_place_pose(place, obj):
             return False
         # TODO how to decide between 180 and 90 deg?
         # allow object to be rotated by 90 deg around z axis
@@ -590,15 +655,18 @@ class ArtBrain(object):
         # TODO: how to deal with this?
         goal.place_pose.pose.position.z = 0.1  # + obj.bbox.dimensions[2]/2
         rospy.loginfo("Place pose: " + str(goal.place_pose))
-        pp_client.send_goal(goal)
-        pp_client.wait_for_result()
         rospy.loginfo("Placing object with ID: " + str(obj.object_id))
-        if pp_client.get_result().result == 0:
-            return True
-        else:
-            return False
 
-    def pick_place_object(self,  obj,  place, pp_client, pick_pose=None):
+        def done_cb(pending):
+            rospy.loginfo("Place of object with ID: " + str(obj.object_id) + " done, success: " + str(pending.success))
+            if pending.success and gripper.holding_object is obj:
+                gripper.holding_object = None
+                gripper.pick_item = None
+
+        self.executor.send(gripper, goal, obj, done_cb, (self.block_id, self.instruction.id))
+        return True
+
+    def pick_place_object(self,  obj,  place, gripper, pick_pose=None):
         goal = pickplaceGoal()
         goal.id = obj.object_id
         if not self.check_place_pose(place, obj):
@@ -618,13 +686,188 @@ class ArtBrain(object):
         # TODO: how to deal with this?
         goal.place_pose.pose.position.z = 0.1  # + obj.bbox.dimensions[2]/2
         rospy.loginfo("Place pose: " + str(goal.place_pose))
-        pp_client.send_goal(goal)
-        pp_client.wait_for_result()
-        if pp_client.get_result().result == 0:
+        self.executor.send(gripper, goal, obj, item=(self.block_id, self.instruction.id))
+        return True
+
+    def wait_for_gripper(self, gripper):
+        """Waits for the previous goal of the gripper, its failure is reported as an error of the instruction which sent it."""
+
+        pending = self.executor.wait(gripper)
+
+        if pending is None or pending.success:
             return True
+
+        if not pending.done:
+            self.fsm.error(severity=ArtBrainMachine.ERROR,
+                           error=ArtBrainMachine.ERROR_NOT_EXECUTING_PROGRAM)
+            return False
+
+        if pending.item is not None and pending.item != (self.block_id, self.instruction.id):
+
+            # error handling (on_failure) applies to the failed instruction, not to the current one
+            (self.block_id, item_id) = pending.item
+            self.instruction = self.ph.get_item_msg(self.block_id, item_id)
+            self.update_state_manager()
+
+        if pending.operation == pickplaceGoal.PICK:
+            if gripper.holding_object is pending.obj:
+                gripper.holding_object = None
+                gripper.pick_item = None
+            self.fsm.error(severity=ArtBrainMachine.WARNING,
+                           error=ArtBrainMachine.ERROR_PICK_FAILED)
         else:
+            self.fsm.error(severity=ArtBrainMachine.WARNING,
+                           error=ArtBrainMachine.ERROR_PLACE_FAILED)
+        return False
+
+    def can_overlap(self, obj):
+        """Pick / place of obj may continue in background only if the program doesn't branch on its result,
+        doesn't end and the following instruction doesn't depend on it."""
+
+        on_success = self.ph.get_id_on_success(self.block_id, self.instruction.id)
+
+        if on_success != self.ph.get_id_on_failure(self.block_id, self.instruction.id) or on_success[0] == 0:
             return False
 
+        return not self.depends_on(on_success[0], self.ph.get_item_msg(*on_success), obj)
+
+    def depends_on(self, block_id, instruction, obj):
+        """Returns True if the instruction uses the object picked / placed by the current instruction."""
+
+        if self.instruction.type != ProgramItem.PLACE_TO_POSE:
+
+            # place of the picked object
+            return instruction.type == ProgramItem.PLACE_TO_POSE and block_id == self.block_id and \
+                self.instruction.id in instruction.ref_id
+
+        if instruction.type == ProgramItem.PICK_OBJECT_ID:
+
+            return ArtBrainUtils.get_instruction_object(instruction) == obj.object_id
+
+        if instruction.type == ProgramItem.PICK_FROM_POLYGON:
+
+            pol = self.ph.get_polygon(block_id, instruction.id)
+
+            if pol is None:
+                return ArtBrainUtils.get_instruction_object(instruction) == obj.object_type
+
+            pose = ArtBrainUtils.get_place_pose(self.instruction)
+            return pol.contains_point([pose.pose.position.x, pose.pose.position.y])
+
+        # another place is checked against the scene, which has to contain the placed object
+        return instruction.type == ProgramItem.PLACE_TO_POSE
+
+    def get_busy_object_ids(self):
+        """Returns ids of objects held or being manipulated by some gripper (tracker still reports them)."""
+
+        busy = set()
+
+        for gripper in self.executor.grippers:
+
+            if gripper.holding_object is not None:
+                busy.add(gripper.holding_object.object_id)
+
+            pending = gripper.pending_goal
+
+            # placed object is free again
+            if pending is not None and pending.obj is not None and not (pending.done and pending.operation == pickplaceGoal.PLACE):
+                busy.add(pending.obj.object_id)
+
+        return busy
+
+    def wait_for_grippers(self):
+
+        for gripper in self.executor.grippers:
+            if not self.wait_for_gripper(gripper):
+                return False
+
+        return True
+
+    # ***************************************************************************************
+    #                                      LOOK-AHEAD
+    # ***************************************************************************************
+
+    def prepare_next_instruction(self):
+        """Starts resolving the instruction following the current one (on success) in background."""
+
+        self.prepared = None
+
+        (block_id, item_id) = self.ph.get_id_on_success(self.block_id, self.instruction.id)
+
+        if block_id == 0:
+            return
+
+        instruction = self.ph.get_item_msg(block_id, item_id)
+
+        if instruction.type not in [ProgramItem.PICK_FROM_POLYGON, ProgramItem.PICK_OBJECT_ID, ProgramItem.PLACE_TO_POSE]:
+            return
+
+        prepared = ArtPreparedInstruction(block_id, item_id, self.scene_version)
+        self.scene_reference = self.objects
+        self.prepared = prepared
+
+        thread = threading.Thread(target=self._prepare_instruction, args=(prepared, instruction))
+        thread.daemon = True
+        thread.start()
+
+    def _prepare_instruction(self, prepared, instruction):
+
+        try:
+
+            busy = self.get_busy_object_ids()
+
+            if instruction.type == ProgramItem.PICK_FROM_POLYGON:
+                prepared.obj = ArtBrainUtils.get_pick_obj_from_polygon(instruction, self.object_index,
+                                                                       self.ph.get_polygon(prepared.block_id, prepared.item_id), busy)
+            elif instruction.type == ProgramItem.PICK_OBJECT_ID:
+                prepared.obj = ArtBrainUtils.get_pick_obj(instruction, self.object_index, busy)
+
+            if instruction.type == ProgramItem.PLACE_TO_POSE:
+
+                pose = ArtBrainUtils.get_place_pose(instruction)
+                gripper = self.get_gripper_for_place(prepared.block_id, instruction)
+
+                if pose is not None and gripper is not None and gripper.holding_object is not None:
+
+                    prepared.gripper = gripper
+                    prepared.obj = gripper.holding_object
+                    prepared.place_ok = self.check_place_pose(pose, prepared.obj)
+
+            elif prepared.obj is not None and prepared.obj.object_id is not None:
+
+                prepared.gripper = self.get_gripper(obj=prepared.obj)
+
+        except Exception, e:
+
+            rospy.logwarn("Failed to prepare instruction: " + str(e))
+            prepared.scene_version = None
+
+        finally:
+
+            prepared.ready.set()
+
+    def get_prepared_instruction(self):
+        """Returns prepared current instruction or None if it was not prepared or the scene has changed since then."""
+
+        prepared = self.prepared
+        self.prepared = None
+
+        if prepared is None or (prepared.block_id, prepared.item_id) != (self.block_id, self.instruction.id):
+            return None
+
+        # if it is not ready yet, it is still faster to wait than to start from scratch (unless it got stuck)
+        if not prepared.ready.wait(self.prepare_timeout):
+
+            rospy.logwarn('Preparation of instruction timed out, resolving it again')
+            return None
+
+        if prepared.scene_version != self.scene_version:
+
+            rospy.logdebug('Scene has changed, prepared instruction discarded')
+            return None
+
+        return prepared
+
     # ***************************************************************************************
     #                                        OTHERS
     # ***************************************************************************************
@@ -657,17 +900,18 @@ class ArtBrain(object):
                 else:
                     return self.left_gripper
             elif obj is not None:
-                for o in self.objects.instances:
-                    if o.object_id == obj.object_id:
-                        obj_pose = PoseStamped()
-                        obj_pose.pose = o.pose
-                        obj_pose.header = self.objects.header
-                        obj_pose = self.tf_listener.transformPose(
-                            '/base_link', obj_pose)
-                        if obj_pose.pose.position.y < 0:
-                            return self.right_gripper
-                        else:
-                            return self.left_gripper
+                index = self.object_index
+                o = index.get(obj.object_id)
+                if o is not None:
+                    obj_pose = PoseStamped()
+                    obj_pose.pose = o.pose
+                    obj_pose.header = index.header
+                    obj_pose = self.tf_listener.transformPose(
+                        '/base_link', obj_pose)
+                    if obj_pose.pose.position.y < 0:
+                        return self.right_gripper
+                    else:
+                        return self.left_gripper
         return self.left_gripper
 
     def get_gripper_holding_object(self, obj):
@@ -678,19 +922,46 @@ class ArtBrain(object):
         else:
             return None
 
+    def get_gripper_for_place(self, block_id, instruction):
+        """Returns gripper holding object picked by one of the picks referenced by the place instruction."""
+
+        for gripper in self.executor.grippers:
+            if gripper.pick_item is not None and gripper.pick_item[0] == block_id and gripper.pick_item[1] in instruction.ref_id:
+                return gripper
+
+        # object given by id
+        object_id = ArtBrainUtils.get_instruction_object(instruction)
+
+        for gripper in self.executor.grippers:
+            if gripper.holding_object is not None and gripper.holding_object.object_id == object_id:
+                return gripper
+
+        return None
+
     def check_place_pose(self, place_pose, obj):
-        w1 = self.get_object_max_width(obj)
-        if w1 is None:
+
+        index = self.object_index
+
+        # resolve all object types on the table using one call
+        object_types = self.art.get_object_types([obj.object_type] + index.get_types())
+
+        if object_types is None:
             return False
-        for o in self.objects.instances:
-            if o.object_id == obj.object_id:
-                continue
-            w2 = self.get_object_max_width(o)
-            if w2 is None:
+
+        widths = {}
+        for (name, object_type) in object_types.iteritems():
+            widths[name] = self.get_object_max_width(object_type)
+            if widths[name] is None:
                 # TODO: how to deal with this
                 return False
-            d = ArtBrainUtils.distance_2d(place_pose.pose, o.pose)
-            if d < (w1 + w2):
+
+        w1 = widths[obj.object_type]
+
+        # only objects closer than w1 + the widest object can collide
+        for (d, o) in index.in_radius(place_pose.pose.position.x, place_pose.pose.position.y, w1 + max(widths.values())):
+            if o.object_id == obj.object_id:
+                continue
+            if d < (w1 + widths[o.object_type]):
                 rospy.logerr('Another object too close to desired place pose')
                 return False
         return True
@@ -767,6 +1038,15 @@ class ArtBrain(object):
             resp.error = 'Cannot get program'
             return resp
 
+        pa = ProgramAnalyzer(self.ph)
+        if not pa.analyze():
+            resp.success = False
+            resp.error = 'Invalid program: ' + '; '.join(pa.errors)
+            rospy.logerr(resp.error)
+            return resp
+
+        rospy.loginfo('Estimated number of actions: ' + str(pa.success_path_actions) + ' (following on_success), at least ' + str(pa.min_actions))
+
         rospy.loginfo('Starting program')
 
         self.program_start()
@@ -777,6 +1057,8 @@ class ArtBrain(object):
 
         rospy.loginfo('Stopping program ' + str(req.program_id) + '...')
         self.executing_program = False
+        self.executor.cancel_all()
+        self.events.cancel()
         return EmptyResponse()
 
     def learning_start_cb(self, req):
@@ -839,38 +1121,39 @@ class ArtBrain(object):
 
     def user_activity_cb(self, req):
         self.user_activity = req.activity
+        self.events.notify()
 
     def objects_cb(self, req):
+        # compared with the snapshot (not the previous message), so slow drift is detected as well
+        reference = self.scene_reference
+        if reference is not None and ArtBrainUtils.scene_changed(reference, req, self.scene_change_threshold):
+            self.scene_version += 1
+            self.scene_reference = None
+        self.object_index = ArtObjectIndex(req, self.object_index_cell_size)
         self.objects = req
 
     def table_calibrated_cb(self, req):
         self.table_calibrated = req.data
+        self.events.notify()
 
     def table_calibrating_cb(self, req):
         self.table_calibrating = req.data
+        self.events.notify()
 
     def system_calibrated_cb(self,  req):
         self.system_calibrated = req.data
+        self.events.notify()
 
-    def get_object_max_width(self, obj):
-        if obj is None:
-            rospy.logerr('No object is specified')
-            return None
-        try:
-            obj_type = self.get_obj_type_srv_client.call(obj.object_type)
-            if not obj_type.success:
-                rospy.logerr('No object with id ' +
-                             str(obj.object_id) + ' found')
-                return None
-            if obj_type.object_type.bbox.type != SolidPrimitive.BOX:
-                rospy.logerr(
-                    'Sorry, only BOX type objects are supported at the moment')
-            x = obj_type.object_type.bbox.dimensions[SolidPrimitive.BOX_X]
-            y = obj_type.object_type.bbox.dimensions[SolidPrimitive.BOX_Y]
-            return np.hypot(x / 2, y / 2)
-        except rospy.ServiceException as e:
-            rospy.logerr('Service call failed: ' + str(e))
+    def get_object_max_width(self, obj_type):
+        if obj_type is None:
+            rospy.logerr('Unknown object type')
             return None
+        if obj_type.bbox.type != SolidPrimitive.BOX:
+            rospy.logerr(
+                'Sorry, only BOX type objects are supported at the moment')
+        x = obj_type.bbox.dimensions[SolidPrimitive.BOX_X]
+        y = obj_type.bbox.dimensions[SolidPrimitive.BOX_Y]
+        return np.hypot(x / 2, y / 2)
 
     def learning_request_cb(self,
                             goal):  # type: LearningRequestGoal
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+import rospy
+import rostest
+from actionlib import GoalStatus
+from art_msgs.msg import pickplaceGoal, pickplaceResult, ObjInstance
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from art_brain.brain_utils import ArtGripper, ArtBrainEvents, ArtPickPlaceExecutor  # noqa
+
+
+class FakeActionClient(object):
+
+    """Stores sent goals instead of sending them, results are given by finish()."""
+
+    def __init__(self):
+
+        self.done_cb = None
+        self.cancelled = False
+
+    def send_goal(self, goal, done_cb=None):
+
+        self.done_cb = done_cb
+
+    def cancel_all_goals(self):
+
+        self.cancelled = True
+
+    def finish(self, result):
+
+        res = pickplaceResult()
+        res.result = result
+        self.done_cb(GoalStatus.SUCCEEDED, res)
+
+
+class TestPickPlaceExecutor(unittest.TestCase):
+
+    def setUp(self):
+
+        self.gripper = ArtGripper("left_arm")
+        self.gripper.pp_client = FakeActionClient()
+        self.executor = ArtPickPlaceExecutor(ArtBrainEvents(), [self.gripper])
+
+    def pick(self, object_id, item):
+
+        goal = pickplaceGoal()
+        goal.operation = goal.PICK
+        goal.id = object_id
+        obj = ObjInstance()
+        obj.object_id = object_id
+        return (obj, self.executor.send(self.gripper, goal, obj, item=item))
+
+    def test_pick(self):
+
+        (obj, pending) = self.pick("obj1", (1, 1))
+
+        self.assertEquals(self.gripper.holding_object, obj, "pick - holding object")
+        self.assertEquals(self.gripper.pick_item, (1, 1), "pick - pick item")
+
+        self.gripper.pp_client.finish(pickplaceResult.SUCCESS)
+
+        self.assertEquals(self.executor.wait(self.gripper, 1.0), pending, "pick - pending goal")
+        self.assertEquals(pending.success, True, "pick - success")
+        self.assertEquals(self.gripper.pending_goal, None, "pick - waited for")
+        self.assertEquals(self.gripper.holding_object, obj, "pick - still holding object")
+
+    def test_cancel_pick(self):
+
+        self.pick("obj1", (1, 1))
+        self.executor.cancel_all()
+
+        self.assertEquals(self.gripper.pp_client.cancelled, True, "cancel_pick - goal cancelled")
+        self.assertEquals(self.gripper.pending_goal, None, "cancel_pick - no pending goal")
+        self.assertEquals(self.gripper.holding_object, None, "cancel_pick - not holding object")
+        self.assertEquals(self.gripper.pick_item, None, "cancel_pick - no pick item")
+
+        # next program picks with the same gripper
+        (obj, pending) = self.pick("obj2", (2, 1))
+        self.gripper.pp_client.finish(pickplaceResult.SUCCESS)
+
+        self.assertEquals(self.executor.wait(self.gripper, 1.0), pending, "cancel_pick - next pick")
+        self.assertEquals(pending.success, True, "cancel_pick - next pick success")
+        self.assertEquals(self.gripper.holding_object, obj, "cancel_pick - holding next object")
+        self.assertEquals(self.gripper.pick_item, (2, 1), "cancel_pick - next pick item")
+
+    def test_cancel_failed_pick(self):
+
+        self.pick("obj1", (1, 1))
+        self.gripper.pp_client.finish(pickplaceResult.FAILURE)
+        self.executor.cancel_all()
+
+        self.assertEquals(self.gripper.pp_client.cancelled, False, "cancel_failed_pick - nothing to cancel")
+        self.assertEquals(self.gripper.holding_object, None, "cancel_failed_pick - not holding object")
+
+    def test_cancel_after_pick(self):
+
+        (obj, pending) = self.pick("obj1", (1, 1))
+        self.gripper.pp_client.finish(pickplaceResult.SUCCESS)
+        self.executor.cancel_all()
+
+        self.assertEquals(self.gripper.holding_object, obj, "cancel_after_pick - holding object")
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('test_node')
+    rostest.run('art_brain', 'test_pick_place_executor', TestPickPlaceExecutor, sys.argv)
@@ -3,9 +3,18 @@
 from art_msgs.msg import Program,  ObjectType
 from art_msgs.srv import getProgram,  getProgramResponse,  getProgramHeaders,  getProgramHeadersResponse, \
     storeProgram,  storeProgramResponse,  getObjectType, getObjectTypeResponse,  storeObjectType,  storeObjectTypeResponse
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from std_msgs.msg import String, UInt16
 import sys
+import threading
 import rospy
-from art_utils import ProgramHelper
+from art_utils import ProgramAnalyzer, ArtCache
+
+# batch lookup of object types needs getObjectTypes service, which older art_msgs don't have
+try:
+    from art_msgs.srv import getObjectTypes, getObjectTypesResponse
+except ImportError:
+    getObjectTypes = None
 
 from mongodb_store.message_store import MessageStoreProxy
 
@@ -16,18 +25,57 @@ class ArtDB:
 
         self.db = MessageStoreProxy()
 
+        # write-through caches - filled on store, on get only in case of miss
+        self.program_cache = ArtCache(rospy.get_param('~program_cache_size', 50))
+        self.object_type_cache = ArtCache(rospy.get_param('~object_type_cache_size', 200))
+
+        # program id -> ProgramHeader, kept up to date on every store (listing headers never loads whole programs)
+        self.program_headers = {}
+        self.program_headers_lock = threading.Lock()
+        self.load_program_headers()
+
         self.srv_get_program = rospy.Service('/art/db/program/get', getProgram, self.srv_get_program_cb)
         self.srv_get_program_headers = rospy.Service('/art/db/program_headers/get', getProgramHeaders, self.srv_get_program_headers_cb)
         self.srv_store_program = rospy.Service('/art/db/program/store', storeProgram, self.srv_store_program_cb)
 
         self.srv_get_object = rospy.Service('/art/db/object_type/get', getObjectType, self.srv_get_object_cb)
+        if getObjectTypes is not None:
+            self.srv_get_objects = rospy.Service('/art/db/object_types/get', getObjectTypes, self.srv_get_objects_cb)
         self.srv_store_object = rospy.Service('/art/db/object_type/store', storeObjectType, self.srv_store_object_cb)
 
+        # name of the changed object type is announced so clients (ArtApiHelper) can drop their cached copy
+        self.object_type_invalidate_pub = rospy.Publisher('/art/db/object_type/invalidate', String, queue_size=10, latch=True)
+
+        # the same for programs (e.g. UI caches whether a program is learned)
+        self.program_invalidate_pub = rospy.Publisher('/art/db/program/invalidate', UInt16, queue_size=10, latch=True)
+
+        self.diag_pub = rospy.Publisher('/art/db/diagnostics', DiagnosticArray, queue_size=1)
+        self.diag_timer = rospy.Timer(rospy.Duration(rospy.get_param('~diagnostics_period', 10.0)), self.diag_timer_cb)
+
         rospy.loginfo('art_db ready')
 
-    def srv_get_program_headers_cb(self,  req):
+    def diag_timer_cb(self, event):
 
-        resp = getProgramHeadersResponse()
+        da = DiagnosticArray()
+        da.header.stamp = rospy.Time.now()
+
+        for (name, cache) in [("program_cache", self.program_cache), ("object_type_cache", self.object_type_cache)]:
+
+            st = DiagnosticStatus()
+            st.level = DiagnosticStatus.OK
+            st.name = "art_db: " + name
+            st.hardware_id = "art_db"
+
+            stats = cache.get_stats()
+            for k in sorted(stats.keys()):
+                st.values.append(KeyValue(k, str(stats[k])))
+
+            st.message = "hits: " + str(stats["hits"]) + ", misses: " + str(stats["misses"])
+            da.status.append(st)
+
+        self.diag_pub.publish(da)
+
+    def load_program_headers(self):
 
         programs = []
 
@@ -36,9 +84,29 @@ class ArtDB:
         except rospy.ServiceException, e:
             print "Service call failed: " + str(e)
 
-        for prog in programs:
-            if len(req.ids) == 0 or prog[0].header.id in req.ids:
-                resp.headers.append(prog[0].header)
+        with self.program_headers_lock:
+
+            for prog in programs:
+                self.program_headers[prog[0].header.id] = prog[0].header
+
+        rospy.loginfo('Loaded ' + str(len(self.program_headers)) + ' program header(s)')
+
+    def srv_get_program_headers_cb(self,  req):
+
+        resp = getProgramHeadersResponse()
+
+        with self.program_headers_lock:
+
+            if len(req.ids) == 0:
+
+                for prog_id in sorted(self.program_headers.keys()):
+                    resp.headers.append(self.program_headers[prog_id])
+
+            else:
+
+                for prog_id in req.ids:
+                    if prog_id in self.program_headers:
+                        resp.headers.append(self.program_headers[prog_id])
 
         return resp
 
@@ -48,12 +116,19 @@ class ArtDB:
         resp.success = False
         name = "program:" + str(req.id)
 
-        prog = None
+        prog = self.program_cache.get(req.id)
 
-        try:
-            prog = self.db.query_named(name, Program._type)[0]
-        except rospy.ServiceException, e:
-            print "Service call failed: " + str(e)
+        if prog is None:
+
+            version = self.program_cache.version(req.id)
+
+            try:
+                prog = self.db.query_named(name, Program._type)[0]
+            except rospy.ServiceException, e:
+                print "Service call failed: " + str(e)
+
+            if prog is not None:
+                self.program_cache.put(req.id, prog, version)
 
         if prog is not None:
 
@@ -66,36 +141,61 @@ class ArtDB:
 
         resp = storeProgramResponse()
 
-        ph = ProgramHelper()
-        if not ph.load(req.program):
+        pa = ProgramAnalyzer()
+        if not pa.analyze(req.program):
 
             resp.success = False
-            resp.error = "Invalid program"
+            resp.error = "Invalid program: " + "; ".join(pa.errors)
             return resp
 
+        for warning in pa.warnings:
+            rospy.logwarn("Program id: " + str(req.program.header.id) + ": " + warning)
+
         name = "program:" + str(req.program.header.id)
 
         try:
             ret = self.db.update_named(name,  req.program,  upsert=True)
         except rospy.ServiceException, e:
             print "Service call failed: " + str(e)
+            self.program_cache.invalidate(req.program.header.id)
             resp.success = False
             return resp
 
+        if ret.success:
+            self.program_cache.put(req.program.header.id, req.program)
+            with self.program_headers_lock:
+                self.program_headers[req.program.header.id] = req.program.header
+            self.program_invalidate_pub.publish(req.program.header.id)
+        else:
+            self.program_cache.invalidate(req.program.header.id)
+
         resp.success = ret.success
         return resp
 
+    def get_object_type(self, obj_type_name):
+
+        object_type = self.object_type_cache.get(obj_type_name)
+
+        if object_type is None:
+
+            version = self.object_type_cache.version(obj_type_name)
+
+            try:
+                object_type = self.db.query_named("object_type:" + str(obj_type_name), ObjectType._type)[0]
+            except rospy.ServiceException, e:
+                print "Service call failed: " + str(e)
+
+            if object_type is not None:
+                self.object_type_cache.put(obj_type_name, object_type, version)
+
+        return object_type
+
     def srv_get_object_cb(self,  req):
 
         resp = getObjectTypeResponse()
         resp.success = False
-        name = "object_type:" + str(req.name)
-        object_type = None
 
-        try:
-            object_type = self.db.query_named(name, ObjectType._type)[0]
-        except rospy.ServiceException, e:
-            print "Service call failed: " + str(e)
+        object_type = self.get_object_type(req.name)
 
         if object_type is not None:
 
@@ -104,6 +204,25 @@ class ArtDB:
 
         return resp
 
+    def srv_get_objects_cb(self,  req):
+
+        resp = getObjectTypesResponse()
+        resp.success = True
+
+        # object_types are in the same order as requested names, unknown types are returned as empty ObjectType
+        for obj_type_name in req.names:
+
+            object_type = self.get_object_type(obj_type_name)
+
+            if object_type is None:
+
+                resp.success = False
+                object_type = ObjectType()
+
+            resp.object_types.append(object_type)
+
+        return resp
+
     def srv_store_object_cb(self,  req):
 
         resp = storeObjectTypeResponse()
@@ -113,9 +232,16 @@ class ArtDB:
             ret = self.db.update_named(name,  req.object_type,  upsert=True)
         except rospy.ServiceException, e:
             print "Service call failed: " + str(e)
+            self.object_type_cache.invalidate(req.object_type.name)
             resp.success = False
             return resp
 
+        if ret.success:
+            self.object_type_cache.put(req.object_type.name, req.object_type)
+            self.object_type_invalidate_pub.publish(req.object_type.name)
+        else:
+            self.object_type_cache.invalidate(req.object_type.name)
+
         resp.success = ret.success
         return resp
 
@@ -11,6 +11,11 @@ from art_msgs.srv import getProgram,  getProgramHeaders,  storeProgram,   getObj
 from shape_msgs.msg import SolidPrimitive
 from geometry_msgs.msg import PoseStamped, PolygonStamped, Point32
 
+try:
+    from art_msgs.srv import getObjectTypes
+except ImportError:
+    getObjectTypes = None
+
 
 class TestArtDb(unittest.TestCase):
 
@@ -22,6 +27,10 @@ class TestArtDb(unittest.TestCase):
         rospy.wait_for_service('/art/db/object_type/get')
 
         self.get_object_srv = rospy.ServiceProxy('/art/db/object_type/get', getObjectType)
+
+        if getObjectTypes is not None:
+            rospy.wait_for_service('/art/db/object_types/get')
+            self.get_objects_srv = rospy.ServiceProxy('/art/db/object_types/get', getObjectTypes)
         self.store_object_srv = rospy.ServiceProxy('/art/db/object_type/store', storeObjectType)
         self.store_program_srv = rospy.ServiceProxy('/art/db/program/store', storeProgram)
         self.get_program_srv = rospy.ServiceProxy('/art/db/program/get', getProgram)
@@ -51,6 +60,45 @@ class TestArtDb(unittest.TestCase):
         self.assertEquals(resp_get.success, True, "object_type_get")
         self.assertEquals(resp_get.object_type.name, "profile_test_1", "object_type_get")
 
+    def test_object_type_update(self):
+
+        ot = ObjectType()
+        ot.name = "profile_test_2"
+        ot.bbox.type = SolidPrimitive.BOX
+        ot.bbox.dimensions = [0.1, 0.1, 0.1]
+
+        try:
+            self.store_object_srv(ot)
+            self.get_object_srv(name="profile_test_2")  # now it should be cached
+            ot.bbox.dimensions = [0.2, 0.1, 0.1]
+            resp_store = self.store_object_srv(ot)
+            resp_get = self.get_object_srv(name="profile_test_2")
+        except rospy.ServiceException:
+            pass
+
+        self.assertEquals(resp_store.success, True, "object_type_update_store")
+        self.assertEquals(resp_get.success, True, "object_type_update_get")
+        self.assertAlmostEquals(resp_get.object_type.bbox.dimensions[0], 0.2, msg="object_type_update_get")
+
+    @unittest.skipIf(getObjectTypes is None, "art_msgs without getObjectTypes")
+    def test_object_types(self):
+
+        ot = ObjectType()
+        ot.name = "profile_test_3"
+        ot.bbox.type = SolidPrimitive.BOX
+        ot.bbox.dimensions = [0.1, 0.1, 0.1]
+
+        try:
+            self.store_object_srv(ot)
+            resp_get = self.get_objects_srv(names=["profile_test_3", "profile_test_xy"])
+        except rospy.ServiceException:
+            pass
+
+        self.assertEquals(resp_get.success, False, "object_types_get")
+        self.assertEquals(len(resp_get.object_types), 2, "object_types_get_len")
+        self.assertEquals(resp_get.object_types[0].name, "profile_test_3", "object_types_get_known")
+        self.assertEquals(resp_get.object_types[1].name, "", "object_types_get_unknown")
+
     def test_invalid_object_type(self):
 
         try:
@@ -193,6 +241,13 @@ class TestArtDb(unittest.TestCase):
         self.assertEquals(len(resp_headers.headers), 1, "program_headers_len")
         self.assertEquals(resp_headers.headers[0].id, 999, "program_headers_id")
 
+        try:
+            resp_headers = self.get_program_headers_srv(ids=[])
+        except rospy.ServiceException:
+            pass
+
+        self.assertEquals(999 in [h.id for h in resp_headers.headers], True, "program_headers_all")
+
     def test_invalid_program_get(self):
 
         try:
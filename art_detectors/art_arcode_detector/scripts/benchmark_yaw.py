@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import numpy as np
+from tf import transformations
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from detector import yaw_quaternions  # noqa
+
+# compares per-marker yaw projection (as the detector used to do it) with vectorized yaw_quaternions
+
+
+def yaw_loop(quats):
+
+    ret = []
+
+    for q in quats:
+
+        angles = transformations.euler_from_quaternion(q)
+        ret.append(transformations.quaternion_from_euler(0, 0, angles[2]))
+
+    return ret
+
+
+def main(args):
+
+    msgs = 2000
+
+    if len(args) > 1:
+        msgs = int(args[1])
+
+    for n in [1, 10, 50]:
+
+        quats = [transformations.random_quaternion() for i in range(0, n)]
+        buf = np.zeros((n, 4))
+
+        start = time.time()
+        for m in range(0, msgs):
+            res = yaw_loop(quats)
+        loop = time.time() - start
+
+        start = time.time()
+        for m in range(0, msgs):
+            for i in range(0, n):
+                buf[i] = quats[i]
+            yaw_quaternions(buf, out=buf)
+        vect = time.time() - start
+
+        # quaternions q and -q are the same rotation
+        err = np.max(np.abs(np.abs(np.einsum('ij,ij->i', np.array(res), buf)) - 1.0))
+
+        print "Markers: %d, per-marker loop: %.0f msgs/s, vectorized: %.0f msgs/s (max. error %.2g)" % (n, msgs / loop, msgs / vect, err)
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv)
+    except KeyboardInterrupt:
+        print("Shutting down")
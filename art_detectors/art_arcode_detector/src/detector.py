@@ -3,88 +3,228 @@
 from ar_track_alvar_msgs.msg import AlvarMarkers
 from art_msgs.msg import ObjInstance, InstancesArray
 import rospy
-from visualization_msgs.msg import Marker
+from visualization_msgs.msg import Marker, MarkerArray
 from geometry_msgs.msg import Point
-from tf import transformations
-import copy
-from art_utils import ArtApiHelper
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+import threading
+import numpy as np
+from art_utils import ArtApiHelper, ArtCache
+
+
+def yaw_quaternions(q, out=None):
+    """Keeps only rotation around z axis of quaternions (Nx4: x, y, z, w). Result may be written in place (out=q)."""
+
+    (x, y, z, w) = (q[:, 0], q[:, 1], q[:, 2], q[:, 3])
+    half_yaw = 0.5 * np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+
+    if out is None:
+        out = np.empty_like(q)
+
+    out[:, 0:2] = 0.0
+    np.sin(half_yaw, out=out[:, 2])
+    np.cos(half_yaw, out=out[:, 3])
+
+    return out
 
 
 class ArCodeDetector:
 
     objects_table = None
+    MISSING = object()  # marks id which is not in the cache (or expired)
 
     def __init__(self):
 
         self.ar_code_sub = rospy.Subscriber("ar_pose_marker", AlvarMarkers, self.ar_code_cb)
         self.detected_objects_pub = rospy.Publisher("/art/object_detector/object", InstancesArray, queue_size=10)
-        self.visualize_pub = rospy.Publisher("art/object_detector/visualize_objects", Marker, queue_size=10)
 
-        # TODO make a timer clearing this cache from time to time
-        self.objects_cache = {}
-        
+        # visualization of bounding boxes (one MarkerArray per frame), max_rate 0 means every frame
+        self.visualize = rospy.get_param("~visualize/enabled", True)
+        max_rate = rospy.get_param("~visualize/max_rate", 0.0)
+        self.visualize_period = rospy.Duration(1.0 / max_rate) if max_rate > 0 else None
+        self.marker_lifetime = rospy.Duration(5)
+        self.last_visualization = rospy.Time(0)
+
+        if self.visualize:
+            self.visualize_pub = rospy.Publisher("art/object_detector/visualize_objects", MarkerArray, queue_size=10)
+
+        # AR code id -> object type name
+        self.objects_table = self.load_objects_table()
+
+        # AR code id -> type / bbox, failed lookups (None) expire sooner so they are retried
+        self.objects_cache = ArtCache(rospy.get_param("~cache/size", 100), rospy.get_param("~cache/ttl", 300.0))
+        self.negative_ttl = rospy.get_param("~cache/negative_ttl", 10.0)
+        self.resolving = set()  # ids being resolved asynchronously
+        self.stale = {}  # AR code id -> last known entry, served while an expired entry is being refreshed
+        self.resolving_lock = threading.Lock()
+
+        # orientations of markers, reused between messages
+        self.ori = np.zeros((16, 4))
+
+        self.diag_pub = rospy.Publisher("/art/object_detector/diagnostics", DiagnosticArray, queue_size=1)
+        self.diag_timer = rospy.Timer(rospy.Duration(rospy.get_param("~diagnostics_period", 10.0)), self.diag_timer_cb)
+
         self.art = ArtApiHelper()
         self.art.wait_for_api()
 
+        self.preload_object_types()
+
+    @staticmethod
+    def load_objects_table():
+
+        # list of {id: AR code id, type: object type name}
+        table = rospy.get_param("~objects", [{"id": 3, "type": "profile_20_60"}, {"id": 4, "type": "profile_20_60"},
+                                             {"id": 5, "type": "profile_20_60"}])
+        return dict((int(entry["id"]), entry["type"]) for entry in table)
+
+    def preload_object_types(self):
+        """Resolves types of all ids from the table using one service call."""
+
+        types = self.art.get_object_types(self.objects_table.values())
+
+        if types is None:
+
+            rospy.logwarn("Failed to preload object types, they will be resolved on demand")
+            return
+
+        for (aid, name) in self.objects_table.iteritems():
+            self.cache_put(aid, self.cache_entry(types.get(name)))
+
+        rospy.loginfo("Preloaded " + str(len(types)) + " object type(s) for " + str(len(self.objects_table)) + " AR code(s)")
+
+    @staticmethod
+    def cache_entry(object_type):
+
+        if object_type is None:
+            return None
+
+        return {'type': object_type.name, 'bb': object_type.bbox, 'box': ArCodeDetector.box_points(object_type.bbox)}
+
+    def cache_put(self, aid, entry):
+
+        if entry is None:
+            self.objects_cache.put(aid, None, ttl=self.negative_ttl)
+            self.stale.pop(aid, None)
+        else:
+            self.objects_cache.put(aid, entry)
+            self.stale[aid] = entry
+
+    def resolve_async(self, aid):
+        """Starts resolution of the id's type, marker is ignored (or the stale entry is used) until it's done."""
+
+        with self.resolving_lock:
+
+            if aid in self.resolving:
+                return
+
+            self.resolving.add(aid)
+
+        def done_cb(future):
+
+            object_type = future.result()
+
+            if object_type is None:
+                # error or unknown object - let's ignore it
+                rospy.logwarn("Failed to get type of AR code: " + str(aid))
+
+            self.cache_put(aid, self.cache_entry(object_type))
+
+            with self.resolving_lock:
+                self.resolving.discard(aid)
+
+        self.art.get_object_type_async(self.objects_table[aid]).add_done_callback(done_cb)
+
+    def get_cached(self, aid):
+        """Returns cached type / bbox of the id or None (unknown or not yet resolved id)."""
+
+        # negative entries are stored as None, missing / expired ones are returned as MISSING
+        entry = self.objects_cache.get(aid, ArCodeDetector.MISSING)
+
+        if entry is not ArCodeDetector.MISSING:
+            return entry
+
+        self.resolve_async(aid)
+
+        # keep the marker tracked while its type is being refreshed
+        return self.stale.get(aid)
+
+    def diag_timer_cb(self, event):
+
+        da = DiagnosticArray()
+        da.header.stamp = rospy.Time.now()
+
+        st = DiagnosticStatus()
+        st.level = DiagnosticStatus.OK
+        st.name = "art_arcode_detector: object type cache"
+        st.hardware_id = "art_arcode_detector"
+
+        stats = self.objects_cache.get_stats()
+        for k in sorted(stats.keys()):
+            st.values.append(KeyValue(k, str(stats[k])))
+
+        st.message = "hits: " + str(stats["hits"]) + ", misses: " + str(stats["misses"]) + ", expirations: " + str(stats["expirations"])
+        da.status.append(st)
+
+        self.diag_pub.publish(da)
+
     def ar_code_cb(self, data):
 
         rospy.logdebug("New arcodes arrived:")
         instances = InstancesArray()
-        id = 0
+
+        now = rospy.Time.now()
+        markers = None
+
+        if self.visualize and (self.visualize_period is None or now - self.last_visualization >= self.visualize_period):
+            markers = MarkerArray()
+
+        accepted = []  # (marker, cached type)
 
         for arcode in data.markers:
 
             aid = int(arcode.id)
 
-            # list of allowed object ids
-            # TODO load from param
-            if aid not in [4, 5, 3]: 
+            # only ids from the table are allowed
+            if aid not in self.objects_table:
                 continue
 
-            if aid not in self.objects_cache:
+            cached = self.get_cached(aid)
 
-                # TODO AR code ID / object type assignment should be done somewhere...
-                # type "profile_20_60" is just for example (used in art_db/test_db.py)
+            # skip unknown objects (and objects being resolved)
+            if cached is None:
+                continue
 
-                object_type = self.art.get_object_type("profile_20_60")
+            accepted.append((arcode, cached))
 
-                if object_type is None:
+        n = len(accepted)
 
-                    # error or unknown object - let's ignore it
-                    self.objects_cache[aid] = None
-                    continue
+        if n > len(self.ori):
+            self.ori = np.zeros((2 * n, 4))
 
-                self.objects_cache[aid] = {'type': object_type.name,  'bb': object_type.bbox}
+        ori = self.ori[:n]
 
-            # skip unknown objects
-            if self.objects_cache[aid] is None:
-                continue
+        for (i, (arcode, cached)) in enumerate(accepted):
+
+            o = arcode.pose.pose.orientation
+            ori[i] = (o.x, o.y, o.z, o.w)
+
+        # objects lie on the table - keep only yaw (for all markers at once)
+        yaw_quaternions(ori, out=ori)
+
+        for (i, (arcode, cached)) in enumerate(accepted):
 
             obj_in = ObjInstance()
-            obj_in.object_id = str(aid)
-            obj_in.object_type = self.objects_cache[aid]['type']
+            obj_in.object_id = str(arcode.id)
+            obj_in.object_type = cached['type']
             obj_in.pose = arcode.pose.pose
+            (obj_in.pose.orientation.x, obj_in.pose.orientation.y, obj_in.pose.orientation.z, obj_in.pose.orientation.w) = ori[i]
+            obj_in.pose.position.z = float(cached['bb'].dimensions[2]/2)
 
-            angles = transformations.euler_from_quaternion([obj_in.pose.orientation.x,
-                                                            obj_in.pose.orientation.y,
-                                                            obj_in.pose.orientation.z,
-                                                            obj_in.pose.orientation.w])
-
-            q = transformations.quaternion_from_euler(0, 0, angles[2])
-            obj_in.pose.orientation.x = q[0]
-            obj_in.pose.orientation.y = q[1]
-            obj_in.pose.orientation.z = q[2]
-            obj_in.pose.orientation.w = q[3]
-            # print self.objects_cache[aid]['bb']
-            obj_in.pose.position.z = float(self.objects_cache[aid]['bb'].dimensions[2]/2)
-            self.show_rviz_bb(obj_in, arcode.id, self.objects_cache[aid]['bb'])
-            # obj_in.pose.position.z *= -1.0
+            if markers is not None:
+                markers.markers += self.rviz_bb_markers(obj_in, arcode.id, cached, arcode.header)
 
             instances.header.stamp = arcode.header.stamp
             instances.header.frame_id = arcode.header.frame_id
             instances.instances.append(obj_in)
-            ++id
-
 
         if len(data.markers) == 0:
             rospy.logdebug("Empty")
@@ -92,68 +232,67 @@ class ArCodeDetector:
             #print instances
             self.detected_objects_pub.publish(instances)
 
-    def show_rviz_bb(self, obj_in, id, bb):
-        '''
+        if markers is not None and len(markers.markers) > 0:
+
+            self.visualize_pub.publish(markers)
+            self.last_visualization = now
+
+    @staticmethod
+    def box_points(bb):
+        """Returns LINE_LIST points (edges) of the bounding box centered at origin."""
+
+        dx = float(bb.dimensions[0]/2)
+        dy = float(bb.dimensions[1]/2)
+        dz = float(bb.dimensions[2]/2)
+
+        corners = [(-dx, -dy), (+dx, -dy), (+dx, +dy), (-dx, +dy)]
+        points = []
+
+        for (i, (x, y)) in enumerate(corners):
+
+            (nx, ny) = corners[(i + 1) % 4]
+
+            points += [Point(x, y, -dz), Point(nx, ny, -dz)]  # bottom
+            points += [Point(x, y, -dz), Point(x, y, +dz)]  # side
+            points += [Point(x, y, +dz), Point(nx, ny, +dz)]  # top
+
+        return points
+
+    def rviz_bb_markers(self, obj, id, cached, header):
+        """Returns bounding box and label markers of the object.
 
         :type obj: ObjInstance
-        :return:
-        '''
-        obj = copy.deepcopy(obj_in)
+        """
+
         marker = Marker()
+        marker.header = header
         marker.type = marker.LINE_LIST
         marker.id = int(id)
         marker.action = marker.ADD
         marker.scale.x = 0.001
         marker.scale.y = 0.01
         marker.scale.z = 0.01
-        marker.color.r = 0
         marker.color.g = 1
-        marker.color.b = 0
         marker.color.a = 1
-        marker.lifetime = rospy.Duration(5)
+        marker.lifetime = self.marker_lifetime
         marker.pose = obj.pose
-
-        bbox_x = float(bb.dimensions[0]/2)
-        bbox_y = float(bb.dimensions[1]/2)
-        bbox_z = float(bb.dimensions[2])
-        marker.points = [
-            Point(- bbox_x,- bbox_y, - bbox_z/2),
-            Point(+ bbox_x,- bbox_y, - bbox_z/2),
-            Point(+ bbox_x,- bbox_y, - bbox_z/2),
-            Point(+ bbox_x,+ bbox_y, - bbox_z/2),
-            Point(+ bbox_x,+ bbox_y, - bbox_z/2),
-            Point(- bbox_x,+ bbox_y, - bbox_z/2),
-            Point(- bbox_x,+ bbox_y, - bbox_z/2),
-            Point(- bbox_x,- bbox_y, - bbox_z/2),
-
-            Point(- bbox_x,- bbox_y, - bbox_z/2),
-            Point(- bbox_x,- bbox_y,  + bbox_z/2),
-            Point(+ bbox_x,- bbox_y, - bbox_z/2),
-            Point(+ bbox_x,- bbox_y,  + bbox_z/2),
-            Point(+ bbox_x,+ bbox_y, - bbox_z/2),
-            Point(+ bbox_x,+ bbox_y,  + bbox_z/2),
-            Point(- bbox_x,+ bbox_y, - bbox_z/2),
-            Point(- bbox_x,+ bbox_y,  + bbox_z/2),
-
-            Point(- bbox_x,- bbox_y,  + bbox_z/2),
-            Point(+ bbox_x,- bbox_y,  + bbox_z/2),
-            Point(+ bbox_x,- bbox_y,  + bbox_z/2),
-            Point(+ bbox_x,+ bbox_y,  + bbox_z/2),
-            Point(+ bbox_x,+ bbox_y,  + bbox_z/2),
-            Point(- bbox_x,+ bbox_y,  + bbox_z/2),
-            Point(- bbox_x,+ bbox_y,  + bbox_z/2),
-            Point(- bbox_x,- bbox_y,  + bbox_z/2),
-        ]
-
-        marker.header.frame_id = "/marker"
-
-        self.visualize_pub.publish(marker)
-        marker.pose.position.z += 0.02 + bbox_z /2
-        marker.id = int(id+100)
-        marker.type = marker.TEXT_VIEW_FACING
-        marker.text = obj.object_id
-        marker.scale.z = 0.02
-        self.visualize_pub.publish(marker)
+        marker.points = cached['box']  # shared, messages are only read during serialization
+
+        label = Marker()
+        label.header = header
+        label.type = label.TEXT_VIEW_FACING
+        label.id = int(id+100)
+        label.action = label.ADD
+        label.scale.z = 0.02
+        label.color = marker.color
+        label.lifetime = self.marker_lifetime
+        label.pose.position.x = obj.pose.position.x
+        label.pose.position.y = obj.pose.position.y
+        label.pose.position.z = obj.pose.position.z + 0.02 + float(cached['bb'].dimensions[2])/2
+        label.pose.orientation = obj.pose.orientation
+        label.text = obj.object_id
+
+        return [marker, label]
 
 if __name__ == '__main__':
     rospy.init_node('art_arcode_detector')
@@ -10,7 +10,7 @@ from art_projected_gui.items import ObjectItem, ButtonItem, PoseStampedCursorIte
 from art_projected_gui.helpers import ProjectorHelper,  conversions
 from art_utils import InterfaceStateManager,  ArtApiHelper, ProgramHelper
 from art_msgs.srv import TouchCalibrationPoints,  TouchCalibrationPointsResponse,  NotifyUser,  NotifyUserResponse
-from std_msgs.msg import Empty,  Bool
+from std_msgs.msg import Empty,  Bool, UInt16
 from std_srvs.srv import Trigger,  TriggerRequest
 from geometry_msgs.msg import PoseStamped
 import actionlib
@@ -70,6 +70,8 @@ class UICoreRos(UICore):
 
         self.state_manager = InterfaceStateManager("PROJECTED UI", cb=self.interface_state_cb)
         self.ph = ProgramHelper()
+        self.programs_learned = {}  # program id -> learned flag, dropped when art_db announces a change of the program
+        self.program_invalidate_sub = rospy.Subscriber('/art/db/program/invalidate', UInt16, self.program_invalidate_cb)
 
         cursors = rospy.get_param("~cursors", [])
         for cur in cursors:
@@ -90,7 +92,7 @@ class UICoreRos(UICore):
         self.learning_action_cl = actionlib.SimpleActionClient('/art/brain/learning_request', LearningRequestAction)
         self.learning_action_cl.wait_for_server()
 
-        self.art = ArtApiHelper()
+        self.art = ArtApiHelper(persistent=True)
 
         self.projectors_calibrated_pub = rospy.Publisher("~projectors_calibrated", Bool, queue_size=1, latch=True)
         self.projectors_calibrated_pub.publish(False)
@@ -479,8 +481,13 @@ class UICoreRos(UICore):
         if not self.art.store_program(prog):
 
             self.notif(translate("UICoreRos", "Failed to store program"), temp=True)
+            self.programs_learned.pop(prog.header.id, None)
             # TODO what to do?
 
+        else:
+
+            self.programs_learned[prog.header.id] = self.ph.program_learned()
+
         self.notif(translate("UICoreRos", "Program stored with ID=") + str(prog.header.id), temp=True)
 
         resp = None
@@ -581,17 +588,26 @@ class UICoreRos(UICore):
 
         for header in headers:
 
-            ph = ProgramHelper()
-            d[header.id] = None
+            # only programs which were not seen yet have to be loaded
+            if header.id not in self.programs_learned:
+
+                ph = ProgramHelper()
 
-            if ph.load(self.art.load_program(header.id)):
+                if ph.load(self.art.load_program(header.id)):
 
-                d[header.id] = ph.program_learned()
+                    self.programs_learned[header.id] = ph.program_learned()
+
+            d[header.id] = self.programs_learned.get(header.id)
 
         # rospy.loginfo(str(d))
         self.program_list = ProgramListItem(self.scene, self.rpm, pos[0], pos[1], headers,  d, prog_id, self.program_selected_cb)
         self.scene_items.append(self.program_list)
 
+    def program_invalidate_cb(self, msg):
+
+        # program was stored (by anyone), it will be loaded again when the list is shown
+        self.programs_learned.pop(msg.data, None)
+
     def object_cb(self, msg):
 
         self.emit(QtCore.SIGNAL('objects'), msg)
@@ -603,6 +619,8 @@ class UICoreRos(UICore):
             self.remove_object(obj_id)
             self.notif(translate("UICoreRos", "Object") + " ID=" + str(obj_id) + " " + translate("UICoreRos", "disappeared"), temp=True)
 
+        new_instances = []
+
         for inst in msg.instances:
 
             obj = self.get_object(inst.object_id)
@@ -610,10 +628,22 @@ class UICoreRos(UICore):
             if obj:
                 obj.set_pos(inst.pose.position.x, inst.pose.position.y,  yaw=conversions.quaternion2yaw(inst.pose.orientation))
             else:
+                new_instances.append(inst)
+
+        if len(new_instances) == 0:
+            return
+
+        # types of all new objects are resolved using one call
+        obj_types = self.art.get_object_types([inst.object_type for inst in new_instances])
+
+        if obj_types is None:
+            obj_types = {}
+
+        for inst in new_instances:
 
-                obj_type = self.art.get_object_type(inst.object_type)
-                self.add_object(inst.object_id, obj_type, inst.pose.position.x, inst.pose.position.y, conversions.quaternion2yaw(inst.pose.orientation),  self.object_selected)
-                self.notif(translate("UICoreRos", "New object") + " ID=" + str(inst.object_id), temp=True)
+            obj_type = obj_types.get(inst.object_type)
+            self.add_object(inst.object_id, obj_type, inst.pose.position.x, inst.pose.position.y, conversions.quaternion2yaw(inst.pose.orientation),  self.object_selected)
+            self.notif(translate("UICoreRos", "New object") + " ID=" + str(inst.object_id), temp=True)
 
     def polygon_changed(self, pts):
 
@@ -532,6 +532,7 @@ class ProgramItem(Item):
         msg.pose[0].pose.position.y = y
         msg.pose[0].pose.orientation = conversions.yaw2quaternion(yaw)
 
+        self.ph.update_item(self.block_id, self.item_id, msg)
         self._update_item()
 
     def set_object(self, obj):
@@ -539,6 +540,7 @@ class ProgramItem(Item):
         msg = self.get_current_item()
         msg.object = [obj]
 
+        self.ph.update_item(self.block_id, self.item_id, msg)
         self._update_item()
 
     def set_polygon(self, pts):
@@ -551,6 +553,7 @@ class ProgramItem(Item):
 
             msg.polygon[0].polygon.points.append(Point32(pt[0], pt[1], 0))
 
+        self.ph.update_item(self.block_id, self.item_id, msg)
         self._update_item()
 
     def _update_block(self, block_id):
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import numpy as np
+from geometry_msgs.msg import Pose
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from tracker import ObjectFilter  # noqa
+
+# compares per-object filtering (as the tracker used to do it) with vectorized ObjectFilter
+
+
+def filter_pose(old, new, ap=0.25, ao=0.1):
+
+    p = Pose()
+
+    if np.dot([old.orientation.x, old.orientation.y, old.orientation.z, old.orientation.w],
+              [new.orientation.x, new.orientation.y, new.orientation.z, new.orientation.w]) < 0.0:
+
+        new.orientation.x *= -1.0
+        new.orientation.y *= -1.0
+        new.orientation.z *= -1.0
+        new.orientation.w *= -1.0
+
+    p.position.x = (1.0 - ap)*old.position.x + ap*new.position.x
+    p.position.y = (1.0 - ap)*old.position.y + ap*new.position.y
+    p.position.z = (1.0 - ap)*old.position.z + ap*new.position.z
+
+    p.orientation.x = (1.0 - ao)*old.orientation.x + ao*new.orientation.x
+    p.orientation.y = (1.0 - ao)*old.orientation.y + ao*new.orientation.y
+    p.orientation.z = (1.0 - ao)*old.orientation.z + ao*new.orientation.z
+    p.orientation.w = (1.0 - ao)*old.orientation.w + ao*new.orientation.w
+
+    return p
+
+
+def to_pose(pos, ori):
+
+    p = Pose()
+    (p.position.x, p.position.y, p.position.z) = pos
+    (p.orientation.x, p.orientation.y, p.orientation.z, p.orientation.w) = ori
+    return p
+
+
+def main(args):
+
+    msgs = 200
+
+    if len(args) > 1:
+        msgs = int(args[1])
+
+    for n in [10, 100, 300, 1000]:
+
+        ids = ["obj_" + str(i) for i in range(0, n)]
+        types = ["profile"] * n
+        pos = np.random.uniform(0, 1, (n, 3))
+        ori = np.tile([0.0, 0.0, 0.0, 1.0], (n, 1)) + np.random.normal(0, 0.01, (n, 4))
+
+        poses = dict((ids[i], to_pose(pos[i], ori[i])) for i in range(0, n))
+        start = time.time()
+        for m in range(0, msgs):
+            for i in range(0, n):
+                poses[ids[i]] = filter_pose(poses[ids[i]], to_pose(pos[i], ori[i]))
+        loop = time.time() - start
+
+        f = ObjectFilter()
+        f.update(ids, types, pos, ori.copy(), 0.0)
+        start = time.time()
+        for m in range(0, msgs):
+            f.update(ids, types, pos, ori.copy(), float(m))
+        vect = time.time() - start
+
+        print "Objects: %d, per-object loop: %.0f msgs/s, vectorized: %.0f msgs/s (%.0f objects/s)" % (n, msgs / loop, msgs / vect, n * msgs / vect)
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv)
+    except KeyboardInterrupt:
+        print("Shutting down")
@@ -2,9 +2,409 @@
 import rospy
 from art_msgs.msg import InstancesArray, ObjInstance
 import tf
-from geometry_msgs.msg import Pose, PoseStamped
-from math import sqrt
+from tf import transformations
 import numpy as np
+import threading
+from collections import OrderedDict
+
+
+class ObjectFilter:
+
+    """State of all tracked objects stored in contiguous numpy arrays (one row per object).
+
+        Each message is filtered in one vectorized pass: rows of already known objects are updated at once
+        (quaternion sign correction, exponential filter, normalization), new objects are appended.
+        Pruning of old objects compacts the arrays and rebuilds the id -> row map.
+
+        Object is confirmed (published) after it has been seen min_cnt times.
+
+    """
+
+    # per-row arrays, subclasses may add their own
+    ARRAYS = ["pos", "ori", "cnt", "stamp", "reported", "pub_pos", "pub_ori"]
+
+    def __init__(self, ap=0.25, ao=0.1, min_cnt=5, capacity=64):
+
+        # should be in (0,1)
+        self.ap = ap  # filtering coeficient - position
+        self.ao = ao  # filtering coeficient - orientation
+        self.min_cnt = min_cnt
+
+        self.n = 0
+        self.ids = []  # row -> object id
+        self.types = []  # row -> object type
+        self.rows = {}  # object id -> row
+
+        self.pos = np.zeros((capacity, 3))
+        self.ori = np.zeros((capacity, 4))
+        self.cnt = np.zeros(capacity, dtype=np.int32)
+        self.stamp = np.zeros(capacity)  # last seen (seconds)
+        self.reported = np.zeros(capacity, dtype=np.bool_)  # object was already reported as new
+        self.pub_pos = np.zeros((capacity, 3))  # last published pose
+        self.pub_ori = np.zeros((capacity, 4))
+
+    def __len__(self):
+
+        return self.n
+
+    def _reserve(self, n):
+
+        if n <= len(self.cnt):
+            return
+
+        capacity = max(n, 2 * len(self.cnt))
+
+        for name in self.ARRAYS:
+            arr = getattr(self, name)
+            setattr(self, name, np.resize(arr, (capacity,) + arr.shape[1:]))
+
+    @staticmethod
+    def normalize(q, tolerance=0.00001):
+
+        mag = np.sqrt(np.einsum('ij,ij->i', q, q))
+        fix = np.abs(mag * mag - 1.0) > tolerance
+        q[fix] /= mag[fix, np.newaxis]
+        return q
+
+    def _init_position(self, row, z, stamp, w):
+
+        self.pos[row] = z
+
+    def _filter_positions(self, r, z, stamp, w):
+
+        ap = self.ap * w[:, np.newaxis]
+        self.pos[r] = (1.0 - ap) * self.pos[r] + ap * z
+
+    def update(self, ids, types, pos, ori, stamp, weights=None):
+        """Adds measurements (pos: Nx3, ori: Nx4 quaternions x, y, z, w), returns list of new object ids.
+
+        Optional weights (in (0, 1]) scale influence of each measurement (e.g. by confidence of its source).
+        """
+
+        if weights is None:
+            weights = np.ones(len(ids))
+
+        rows = np.array([self.rows.get(object_id, -1) for object_id in ids], dtype=np.int64)
+        known = rows >= 0
+
+        if np.any(known):
+
+            r = rows[known]
+            q = ori[known]
+
+            # check for q == -q and correct
+            q[np.einsum('ij,ij->i', self.ori[r], q) < 0.0] *= -1.0
+
+            w = weights[known]
+            ao = self.ao * w[:, np.newaxis]
+
+            self._filter_positions(r, pos[known], stamp, w)
+            self.ori[r] = self.normalize((1.0 - ao) * self.ori[r] + ao * q)
+            self.cnt[r] += 1
+            self.stamp[r] = stamp
+
+            for i in np.flatnonzero(known):
+                self.types[rows[i]] = types[i]
+
+        new_ids = []
+
+        for i in np.flatnonzero(~known):
+
+            object_id = ids[i]
+
+            if object_id in self.rows:  # same id twice in one message
+                continue
+
+            self._reserve(self.n + 1)
+
+            self.rows[object_id] = self.n
+            self.ids.append(object_id)
+            self.types.append(types[i])
+            self._init_position(self.n, pos[i], stamp, weights[i])
+            self.ori[self.n] = ori[i]
+            self.normalize(self.ori[self.n:self.n + 1])
+            self.cnt[self.n] = 1
+            self.stamp[self.n] = stamp
+            self.reported[self.n] = False
+            self.n += 1
+
+            new_ids.append(object_id)
+
+        return new_ids
+
+    def confirmed(self):
+        """Returns mask of objects which should be published."""
+
+        return self.cnt[:self.n] >= self.min_cnt
+
+    def positions(self, now):
+        """Returns positions of all objects (estimated for given time)."""
+
+        return self.pos[:self.n]
+
+    def changed(self, now, distance, angle):
+        """Returns True if an object was confirmed or has moved / rotated more than given thresholds since it was published."""
+
+        conf = self.confirmed()
+
+        if np.any(conf & ~self.reported[:self.n]):
+            return True
+
+        d = self.positions(now)[conf] - self.pub_pos[:self.n][conf]
+
+        if np.any(np.einsum('ij,ij->i', d, d) > distance * distance):
+            return True
+
+        # angle between quaternions is 2 * acos(|q1.q2|)
+        dots = np.abs(np.einsum('ij,ij->i', self.ori[:self.n][conf], self.pub_ori[:self.n][conf]))
+        return np.any(dots < np.cos(angle / 2.0))
+
+    def mark_published(self, mask, pos):
+
+        self.reported[:self.n] |= mask
+        self.pub_pos[:self.n][mask] = pos[mask]
+        self.pub_ori[:self.n][mask] = self.ori[:self.n][mask]
+
+    def associate(self, ids, types, pos, stamp, gate, reassign_age):
+        """Matches measurements to objects by type and position, returns list of object ids (None - drop measurement).
+
+        First, measurements keep their ids if the object with the same id (and type) is closer than gate.
+        Remaining measurements are assigned to the nearest free object of the same type within the gate
+        (each object at most once per message), so the result doesn't depend on order of measurements.
+        Unmatched measurement with an unknown id creates a new object. When its id is used by a distant object,
+        the object is moved there only if it was not seen for reassign_age seconds, otherwise it's an outlier.
+        """
+
+        # objects are compared with their positions estimated for the time of measurements
+        est = self.positions(stamp)
+        grid = SpatialHash(est, gate)
+        used = set()
+        ret = [None] * len(ids)
+        rest = []
+
+        for i in range(0, len(ids)):
+
+            row = self.rows.get(ids[i])
+
+            if row is not None and row not in used and self.types[row] == types[i] and \
+                    np.linalg.norm(est[row, 0:2] - pos[i, 0:2]) < gate:
+
+                used.add(row)
+                ret[i] = ids[i]
+
+            else:
+
+                rest.append(i)
+
+        for i in rest:
+
+            row = self.rows.get(ids[i])
+            best = None
+            best_dist = gate
+
+            for r in grid.neighbours(pos[i]):
+
+                if r in used or self.types[r] != types[i]:
+                    continue
+
+                d = np.linalg.norm(est[r, 0:2] - pos[i, 0:2])
+
+                if d < best_dist:
+
+                    best = r
+                    best_dist = d
+
+            if best is not None:
+
+                used.add(best)
+                ret[i] = self.ids[best]
+
+            elif row is None:
+
+                ret[i] = ids[i]
+
+            elif row not in used and stamp - self.stamp[row] > reassign_age:
+
+                used.add(row)
+                self._init_position(row, pos[i], stamp, 1.0)
+                ret[i] = ids[i]
+
+        return ret
+
+    def prune(self, now, max_age):
+        """Removes objects not seen for more than max_age seconds, returns their ids."""
+
+        old = (now - self.stamp[:self.n]) > max_age
+
+        if not np.any(old):
+            return []
+
+        pruned = [self.ids[i] for i in np.flatnonzero(old)]
+        keep = np.flatnonzero(~old)
+        n = len(keep)
+
+        for name in self.ARRAYS:
+            arr = getattr(self, name)
+            arr[:n] = arr[keep]
+
+        self.ids = [self.ids[i] for i in keep]
+        self.types = [self.types[i] for i in keep]
+        self.rows = dict((object_id, row) for (row, object_id) in enumerate(self.ids))
+        self.n = n
+
+        return pruned
+
+
+class KalmanObjectFilter(ObjectFilter):
+
+    """Constant velocity Kalman filter of object positions (orientations are filtered as in ObjectFilter).
+
+        Axes are independent and share the noise model, so one 2x2 covariance (position, velocity) per object
+        is enough. Object is confirmed as soon as standard deviation of its position drops below max_pos_std.
+        With the defaults it takes 5 measurements with full weight at 10-30 Hz, more if they are less trusted
+        or sparse (max_pos_std has to be raised for detectors slower than ~4 Hz).
+        Published positions are extrapolated using estimated velocity (up to max_extrapolation seconds).
+
+    """
+
+    ARRAYS = ObjectFilter.ARRAYS + ["vel", "cov"]
+
+    def __init__(self, ao=0.1, process_noise=0.05, measurement_noise=0.01, max_pos_std=0.008, initial_vel_std=0.5,
+                 max_extrapolation=0.5, capacity=64):
+
+        ObjectFilter.__init__(self, ao=ao, capacity=capacity)
+
+        self.q = process_noise ** 2  # acceleration variance
+        self.r = measurement_noise ** 2
+        self.max_pos_var = max_pos_std ** 2
+        self.initial_vel_var = initial_vel_std ** 2
+        self.max_extrapolation = max_extrapolation
+
+        self.vel = np.zeros((capacity, 3))
+        self.cov = np.zeros((capacity, 2, 2))
+
+    def _init_position(self, row, z, stamp, w):
+
+        self.pos[row] = z
+        self.vel[row] = 0.0
+        self.cov[row] = [[self.r / w, 0.0], [0.0, self.initial_vel_var]]
+
+    def _filter_positions(self, r, z, stamp, w):
+
+        dt = np.maximum(stamp - self.stamp[r], 0.0)
+        P = self.cov[r]
+
+        # predict
+        pos = self.pos[r] + self.vel[r] * dt[:, np.newaxis]
+
+        p00 = P[:, 0, 0] + dt * (P[:, 0, 1] + P[:, 1, 0]) + dt * dt * P[:, 1, 1] + self.q * dt ** 4 / 4.0
+        p01 = P[:, 0, 1] + dt * P[:, 1, 1] + self.q * dt ** 3 / 2.0
+        p11 = P[:, 1, 1] + self.q * dt ** 2
+
+        # update (less trusted measurements are noisier)
+        s = p00 + self.r / w
+        k0 = p00 / s
+        k1 = p01 / s
+        y = z - pos
+
+        self.pos[r] = pos + k0[:, np.newaxis] * y
+        self.vel[r] = self.vel[r] + k1[:, np.newaxis] * y
+
+        P[:, 0, 0] = (1.0 - k0) * p00
+        P[:, 0, 1] = (1.0 - k0) * p01
+        P[:, 1, 0] = P[:, 0, 1]
+        P[:, 1, 1] = p11 - k1 * p01
+        self.cov[r] = P
+
+    def confirmed(self):
+
+        return self.cov[:self.n, 0, 0] < self.max_pos_var
+
+    def positions(self, now):
+
+        dt = np.clip(now - self.stamp[:self.n], 0.0, self.max_extrapolation)
+        return self.pos[:self.n] + self.vel[:self.n] * dt[:, np.newaxis]
+
+
+class SpatialHash:
+
+    """2D grid (x, y) over rows of given positions, built at once by sorting cell keys."""
+
+    def __init__(self, pos, cell_size):
+
+        self.cell_size = cell_size
+
+        keys = self._keys(pos)
+        self.order = np.argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+
+    def _keys(self, pos):
+
+        cells = np.floor(pos[:, 0:2] / self.cell_size).astype(np.int64)
+        return cells[:, 0] * 1000003 + cells[:, 1]
+
+    def neighbours(self, p):
+        """Returns rows in the cell of p and in the 8 surrounding cells."""
+
+        (cx, cy) = np.floor(np.asarray(p[0:2]) / self.cell_size).astype(np.int64)
+        keys = np.array([(cx + dx) * 1000003 + cy + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+        lo = np.searchsorted(self.keys, keys, side='left')
+        hi = np.searchsorted(self.keys, keys, side='right')
+
+        return np.concatenate([self.order[a:b] for (a, b) in zip(lo, hi)])
+
+
+class TransformCache:
+
+    """Bounded cache of recent transforms (LRU), keyed by frame and stamp in nanoseconds.
+
+        Stamps (rospy.Time) are not used as keys directly - equal stamps have to hit the same entry
+        regardless of how genpy hashes them.
+
+    """
+
+    def __init__(self, size=16):
+
+        self.size = size
+        self.data = OrderedDict()
+
+    def __len__(self):
+
+        return len(self.data)
+
+    @staticmethod
+    def key(frame_id, stamp):
+
+        return (frame_id, stamp.to_nsec())
+
+    def get(self, frame_id, stamp):
+
+        key = self.key(frame_id, stamp)
+        value = self.data.pop(key, None)
+
+        if value is not None:
+            self.data[key] = value  # most recently used
+
+        return value
+
+    def put(self, frame_id, stamp, value):
+
+        self.data[self.key(frame_id, stamp)] = value
+
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+
+def quaternion_left_matrix(q):
+    """Returns matrix L so that quaternion product q * p equals L.dot(p) (quaternions as x, y, z, w)."""
+
+    (x, y, z, w) = q
+
+    return np.array([[w, -z, y, x],
+                     [z, w, -x, y],
+                     [-y, x, w, z],
+                     [-x, -y, -z, w]])
 
 
 # "tracking" of static objects
@@ -14,153 +414,244 @@ class tracker:
 
         self.target_frame = target_frame
         self.listener = tf.TransformListener()
-        self.sub = rospy.Subscriber("/art/object_detector/object", InstancesArray, self.cb, queue_size=10)
         self.pub = rospy.Publisher("/art/object_detector/object_filtered", InstancesArray, queue_size=10, latch=True)
-        self.timer = rospy.Timer(rospy.Duration(1.0), self.timer_cb)
-        self.objects = {}
 
-        # should be in (0,1)
-        self.ap = 0.25  # filtering coeficient - position
-        self.ao = 0.1  # filtering coeficient - orientation
-
-        self.min_cnt = 5  # publish object after it has been seen x times at least
         self.max_age = rospy.Duration(50)
 
+        mode = rospy.get_param("~filter", "exponential")
+
+        if mode == "kalman":
+
+            self.objects = KalmanObjectFilter(process_noise=rospy.get_param("~kalman/process_noise", 0.05),
+                                              measurement_noise=rospy.get_param("~kalman/measurement_noise", 0.01),
+                                              max_pos_std=rospy.get_param("~kalman/max_position_std", 0.008))
+
+        else:
+
+            if mode != "exponential":
+                rospy.logwarn("Unknown filter: " + str(mode) + ", using exponential one")
+
+            # publish object after it has been seen min_cnt times at least
+            self.objects = ObjectFilter(ap=0.25, ao=0.1, min_cnt=5)
+
+        self.lock = threading.Lock()  # cb and timer_cb run in different threads
+
+        # (frame_id, stamp) -> (4x4 matrix, quaternion left matrix), all instances in a message share one transform
+        self.transforms = TransformCache(16)
+
+        # timer: publish all objects once per second
+        # on_change: publish when an object appears, is lost or moves, at most max_rate times per second
+        # and at least once per keepalive period
+        self.publish_mode = rospy.get_param("~publish_mode", "timer")
+        self.last_publish = 0.0
+
+        if self.publish_mode == "on_change":
+
+            self.publish_distance = rospy.get_param("~publish/distance", 0.01)
+            self.publish_angle = rospy.get_param("~publish/angle", 0.05)
+            self.min_period = 1.0 / rospy.get_param("~publish/max_rate", 10.0)
+            self.keepalive = rospy.get_param("~publish/keepalive", 1.0)
+            self.timer = rospy.Timer(rospy.Duration(self.min_period), self.check_cb)
+
+        else:
+
+            self.timer = rospy.Timer(rospy.Duration(1.0), self.timer_cb)
+
+        # with more detectors (cameras), detections are associated by type and position instead of trusting ids
+        # and weighted by confidence of the camera and age of the message
+        self.topics = rospy.get_param("~topics", ["/art/object_detector/object"])
+        self.fusion = len(self.topics) > 1
+
+        if self.fusion:
+
+            self.gate = rospy.get_param("~fusion/gate", 0.1)
+            # list of {topic: ..., confidence: (0, 1]}, topics not listed have confidence 1
+            self.confidence = dict((c["topic"], c["confidence"]) for c in rospy.get_param("~fusion/confidence", []))
+            self.staleness = rospy.get_param("~fusion/staleness", 0.5)  # time constant of weight decay
+            self.max_staleness = rospy.get_param("~fusion/max_staleness", 2.0)
+            self.reassign_age = rospy.get_param("~fusion/reassign_age", 1.0)
+
+        self.subs = [rospy.Subscriber(topic, InstancesArray, self.cb, callback_args=topic, queue_size=10) for topic in self.topics]
+
     def timer_cb(self, event):
 
-        ia = InstancesArray()
-        ia.header.frame_id = self.target_frame
-        ia.header.stamp = rospy.Time.now()
+        with self.lock:
 
-        objects_to_prune = []
+            now = rospy.Time.now()
+            pruned = self.objects.prune(now.to_sec(), self.max_age.to_sec())
+            self.publish(now, pruned)
 
-        now = rospy.Time.now()
+    def check_cb(self, event):
 
-        for k, v in self.objects.iteritems():
+        with self.lock:
 
-            if (now - v["pose"].header.stamp) > self.max_age:
+            now = rospy.Time.now()
+            pruned = self.objects.prune(now.to_sec(), self.max_age.to_sec())
 
-                objects_to_prune.append(k)
-                ia.lost_objects.append(k)
-                continue
+            if len(pruned) > 0 or now.to_sec() - self.last_publish >= self.keepalive or \
+                    self.objects.changed(now.to_sec(), self.publish_distance, self.publish_angle):
 
-            if v["cnt"] < self.min_cnt:
-                continue
+                self.publish(now, pruned)
+
+    def publish(self, now, pruned):
+        """Publishes all confirmed objects, has to be called with lock held."""
+
+        ia = InstancesArray()
+        ia.header.frame_id = self.target_frame
+        ia.header.stamp = now
+        ia.lost_objects = pruned
+
+        f = self.objects
+
+        pos = f.positions(now.to_sec())
+        conf = f.confirmed()
+
+        for i in np.flatnonzero(conf):
 
             obj = ObjInstance()
-            obj.pose = v["pose"].pose
-            obj.pose.orientation = self.normalize(obj.pose.orientation)
-            obj.object_id = k
-            obj.object_type = v["object_type"]
+            obj.object_id = f.ids[i]
+            obj.object_type = f.types[i]
+            (obj.pose.position.x, obj.pose.position.y, obj.pose.position.z) = pos[i]
+            (obj.pose.orientation.x, obj.pose.orientation.y, obj.pose.orientation.z, obj.pose.orientation.w) = f.ori[i]
             ia.instances.append(obj)
 
-            if v["cnt"] == self.min_cnt:
-                ia.new_objects.append(k)
+            if not f.reported[i]:
+                ia.new_objects.append(obj.object_id)
+
+        f.mark_published(conf, pos)
+        self.last_publish = now.to_sec()
 
         # TODO also publish TF for each object???
         self.pub.publish(ia)
 
-        for k in objects_to_prune:
+        for k in pruned:
 
             rospy.loginfo("Object " + k + " no longer visible")
-            del self.objects[k]
 
-        if len(objects_to_prune) > 0:
+        if len(pruned) > 0:
 
-            rospy.loginfo("Pruned " + str(len(objects_to_prune)) + " objects")
+            rospy.loginfo("Pruned " + str(len(pruned)) + " objects")
 
-    def normalize(self, q, tolerance=0.00001):
-        v = (q.x, q.y, q.z, q.w)
-        mag2 = sum(n * n for n in v)
-        if abs(mag2 - 1.0) > tolerance:
-                mag = sqrt(mag2)
-                q.x /= mag
-                q.y /= mag
-                q.z /= mag
-                q.w /= mag
-        return q
+    def get_transform(self, header):
+        """Returns (4x4 matrix, quaternion left matrix) from header.frame_id to target frame or None."""
 
-    def transform(self, header, pose):
+        t = self.transforms.get(header.frame_id, header.stamp)
 
-        ps = PoseStamped()
-        ps.header = header
-        ps.pose = pose
+        if t is not None:
+            return t
 
-        if self.target_frame == header.frame_id:
-            return ps
+        try:
 
-        if not self.listener.waitForTransform(self.target_frame, header.frame_id, header.stamp, rospy.Duration(4.0)):
+            if not self.listener.waitForTransform(self.target_frame, header.frame_id, header.stamp, rospy.Duration(4.0)):
 
-            rospy.logwarn("Transform between " + self.target_frame + " and " + header.frame_id + " not available!")
-            return None
+                rospy.logwarn("Transform between " + self.target_frame + " and " + header.frame_id + " not available!")
+                return None
 
-        try:
-
-            ps = self.listener.transformPose(self.target_frame, ps)
+            (trans, rot) = self.listener.lookupTransform(self.target_frame, header.frame_id, header.stamp)
 
         except tf.Exception:
 
             rospy.logerr("TF exception")
             return None
 
-        return ps
+        m = transformations.quaternion_matrix(rot)
+        m[0:3, 3] = trans
 
-    def q2a(self, q):
+        t = (m, quaternion_left_matrix(rot))
+        self.transforms.put(header.frame_id, header.stamp, t)
 
-        return [q.x, q.y, q.z, q.w]
+        return t
 
-    # here we assume that quaternions are close (object is static) -> averaging should be fine
-    def filterPose(self, old, new):
+    def transform(self, header, pos, ori):
+        """Transforms positions (Nx3) and orientations (Nx4) of all instances at once."""
 
-        p = Pose()
+        if self.target_frame == header.frame_id:
+            return (pos, ori)
 
-        # check for q == -q and correct
-        if (np.dot(self.q2a(old.orientation), self.q2a(new.orientation))) < 0.0:
+        t = self.get_transform(header)
 
-                new.orientation.x *= -1.0
-                new.orientation.y *= -1.0
-                new.orientation.z *= -1.0
-                new.orientation.w *= -1.0
+        if t is None:
+            return None
+
+        (m, q) = t
+
+        return (pos.dot(m[0:3, 0:3].T) + m[0:3, 3], ori.dot(q.T))
 
-        p.position.x = (1.0 - self.ap)*old.position.x + self.ap*new.position.x
-        p.position.y = (1.0 - self.ap)*old.position.y + self.ap*new.position.y
-        p.position.z = (1.0 - self.ap)*old.position.z + self.ap*new.position.z
+    def weight(self, topic, stamp, now):
+        """Returns weight of measurements from given topic and time or None if they are too old."""
+
+        age = max(0.0, now - stamp)
+
+        if age > self.max_staleness:
+            return None
 
-        p.orientation.x = (1.0 - self.ao)*old.orientation.x + self.ao*new.orientation.x
-        p.orientation.y = (1.0 - self.ao)*old.orientation.y + self.ao*new.orientation.y
-        p.orientation.z = (1.0 - self.ao)*old.orientation.z + self.ao*new.orientation.z
-        p.orientation.w = (1.0 - self.ao)*old.orientation.w + self.ao*new.orientation.w
+        return self.confidence.get(topic, 1.0) * np.exp(-age / self.staleness)
 
-        return p
+    def cb(self, msg, topic):
 
-    def cb(self, msg):
+        n = len(msg.instances)
+        ids = []
+        types = []
+        pos = np.empty((n, 3))
+        ori = np.empty((n, 4))
 
         for inst in msg.instances:
 
-            ps = self.transform(msg.header, inst.pose)
+            p = inst.pose
+            pos[len(ids)] = (p.position.x, p.position.y, p.position.z)
+            ori[len(ids)] = (p.orientation.x, p.orientation.y, p.orientation.z, p.orientation.w)
+            ids.append(inst.object_id)
+            types.append(inst.object_type)
 
-            if ps is None:
+        ret = self.transform(msg.header, pos, ori)
 
-                return
+        if ret is None:
+            return
 
-            if inst.object_id in self.objects:
+        (pos, ori) = ret
 
-                rospy.logdebug("Updating object: " + inst.object_id)
+        stamp = msg.header.stamp.to_sec()
+        weights = None
 
-                self.objects[inst.object_id]["object_type"] = inst.object_type
-                self.objects[inst.object_id]["cnt"] += 1
-                self.objects[inst.object_id]["pose"].header = ps.header
-                self.objects[inst.object_id]["pose"].pose = self.filterPose(self.objects[inst.object_id]["pose"].pose, ps.pose)
+        with self.lock:
 
-            else:
+            if self.fusion:
+
+                w = self.weight(topic, stamp, rospy.Time.now().to_sec())
+
+                if w is None:
+
+                    rospy.logdebug("Dropping old message from " + topic)
+                    return
+
+                ids = self.objects.associate(ids, types, pos, stamp, self.gate, self.reassign_age)
+                keep = np.array([object_id is not None for object_id in ids], dtype=np.bool_)
+
+                if not np.all(keep):
+
+                    rospy.logdebug("Dropping " + str(len(ids) - np.count_nonzero(keep)) + " outliers from " + topic)
+                    ids = [object_id for object_id in ids if object_id is not None]
+                    types = [t for (t, k) in zip(types, keep) if k]
+                    pos = pos[keep]
+                    ori = ori[keep]
+
+                weights = np.repeat(w, len(ids))
+
+            new_ids = self.objects.update(ids, types, pos, ori, stamp, weights)
+
+            if self.publish_mode == "on_change":
+
+                # otherwise it will be published by check_cb
+                now = rospy.Time.now()
+
+                if now.to_sec() - self.last_publish >= self.min_period and \
+                        self.objects.changed(now.to_sec(), self.publish_distance, self.publish_angle):
 
-                rospy.loginfo("Adding new object: " + inst.object_id)
+                    self.publish(now, [])
 
-                obj = {}
-                obj["pose"] = ps
-                obj["cnt"] = 1
+        for object_id in new_ids:
 
-                self.objects[inst.object_id] = obj
+            rospy.loginfo("Adding new object: " + object_id)
 
 if __name__ == '__main__':
         try:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+import rospy
+import rostest
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from tracker import KalmanObjectFilter  # noqa
+
+ORI = np.array([[0.0, 0.0, 0.0, 1.0]])
+
+
+class TestKalmanObjectFilter(unittest.TestCase):
+
+    def setUp(self):
+
+        self.f = KalmanObjectFilter()
+
+    def measure(self, cnt, dt=0.1, start=0.0, vel=0.0, weight=1.0):
+        """Feeds cnt measurements of object A moving along x, returns number of measurements until it was confirmed."""
+
+        confirmed = None
+
+        for i in range(0, cnt):
+
+            t = start + i * dt
+            self.f.update(["A"], ["profile"], np.array([[vel * t, 0.0, 0.0]]), ORI.copy(), t, np.array([weight]))
+
+            if confirmed is None and self.f.confirmed()[0]:
+                confirmed = i + 1
+
+        return confirmed
+
+    def test_prediction(self):
+
+        self.measure(50, vel=0.2)
+
+        self.assertAlmostEquals(self.f.vel[0, 0], 0.2, 2, "prediction - velocity")
+
+        # last measurement at 4.9 s, position is extrapolated
+        self.assertAlmostEquals(self.f.positions(5.1)[0, 0], 0.2 * 5.1, 2, "prediction - extrapolated")
+
+        # ...but not further than max_extrapolation
+        self.assertAlmostEquals(self.f.positions(10.0)[0, 0], 0.2 * (4.9 + self.f.max_extrapolation), 2, "prediction - max_extrapolation")
+
+    def test_gating(self):
+
+        self.measure(50, vel=0.2)
+
+        # another camera reports the moving object under a different id, close to its predicted position
+        res = self.f.associate(["X"], ["profile"], np.array([[0.2 * 5.2, 0.0, 0.0]]), 5.2, 0.02, 1.0)
+        self.assertEquals(res, ["A"], "gating - predicted position")
+
+        # last filtered position is too far
+        res = self.f.associate(["X"], ["profile"], np.array([[0.2 * 4.9, 0.0, 0.0]]), 5.2, 0.02, 1.0)
+        self.assertEquals(res, ["X"], "gating - last position")
+
+    def test_confirmation(self):
+
+        full = self.measure(50)
+
+        self.assertTrue(full is not None and full > 2, "confirmation - full weight " + str(full))
+
+        self.f = KalmanObjectFilter()
+        half = self.measure(50, weight=0.5)
+
+        # less trusted measurements are needed more
+        self.assertTrue(half is not None and half > full, "confirmation - half weight " + str(half))
+
+    def test_removal(self):
+
+        self.measure(10)
+
+        # last seen at 0.9 s
+        self.assertEquals(self.f.prune(10.8, 10.0), [], "removal - not yet")
+        self.assertEquals(len(self.f), 1, "removal - kept")
+        self.assertEquals(self.f.prune(11.0, 10.0), ["A"], "removal - pruned")
+        self.assertEquals(len(self.f), 0, "removal - removed")
+
+        # seen again - starts from scratch
+        self.measure(1, start=12.0)
+        self.assertEquals(self.f.confirmed()[0], False, "removal - not confirmed again")
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('test_node')
+    rostest.run('art_simple_tracker', 'test_kalman_object_filter', TestKalmanObjectFilter, sys.argv)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+import rospy
+import rostest
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from tracker import ObjectFilter  # noqa
+
+
+class ListObjectFilter:
+
+    """Original filter of the tracker (dictionary of objects, updated one by one), used as a reference."""
+
+    def __init__(self, ap=0.25, ao=0.1):
+
+        self.ap = ap
+        self.ao = ao
+        self.objects = {}
+
+    def update(self, ids, types, pos, ori, stamp):
+
+        for i in range(0, len(ids)):
+
+            p = list(pos[i])
+            q = list(ori[i])
+
+            if ids[i] not in self.objects:
+
+                self.objects[ids[i]] = {"pos": p, "ori": q, "cnt": 1, "stamp": stamp, "type": types[i]}
+                continue
+
+            obj = self.objects[ids[i]]
+
+            # check for q == -q and correct
+            if np.dot(obj["ori"], q) < 0.0:
+                q = [-v for v in q]
+
+            obj["pos"] = [(1.0 - self.ap) * a + self.ap * b for (a, b) in zip(obj["pos"], p)]
+            obj["ori"] = [(1.0 - self.ao) * a + self.ao * b for (a, b) in zip(obj["ori"], q)]
+            obj["cnt"] += 1
+            obj["stamp"] = stamp
+            obj["type"] = types[i]
+
+    def prune(self, now, max_age):
+
+        pruned = [k for (k, v) in self.objects.iteritems() if now - v["stamp"] > max_age]
+
+        for k in pruned:
+            del self.objects[k]
+
+        return pruned
+
+    @staticmethod
+    def normalize(q):
+
+        mag = np.sqrt(sum(v * v for v in q))
+        return [v / mag for v in q]
+
+
+class TestObjectFilter(unittest.TestCase):
+
+    def setUp(self):
+
+        self.f = ObjectFilter()
+        self.f.update(["A"], ["profile"], np.array([[0.0, 0.0, 0.0]]), np.array([[0.0, 0.0, 0.0, 1.0]]), 0.0)
+
+    def random_messages(self, cnt, ids):
+        """Yields (ids, types, pos, ori) of messages with random subsets of objects, noisy poses and flipped quaternions."""
+
+        rnd = np.random.RandomState(1)
+        base = dict((object_id, (rnd.uniform(0.0, 1.0, 3), rnd.normal(0.0, 1.0, 4))) for object_id in ids)
+
+        for i in range(0, cnt):
+
+            msg_ids = [object_id for object_id in ids if rnd.uniform() < 0.7]
+            pos = np.array([base[object_id][0] + rnd.normal(0.0, 0.01, 3) for object_id in msg_ids]).reshape(-1, 3)
+            ori = np.array([base[object_id][1] / np.linalg.norm(base[object_id][1]) + rnd.normal(0.0, 0.01, 4) for object_id in msg_ids]).reshape(-1, 4)
+            ori *= rnd.choice([-1.0, 1.0], (len(msg_ids), 1))
+
+            yield (msg_ids, ["type_" + object_id for object_id in msg_ids], pos, ori)
+
+    def assert_same(self, f, ref, name):
+
+        self.assertEquals(sorted(f.ids), sorted(ref.objects.keys()), name + " - ids")
+
+        for object_id in f.ids:
+
+            row = f.rows[object_id]
+            obj = ref.objects[object_id]
+
+            self.assertEquals(f.types[row], obj["type"], name + " - type")
+            self.assertEquals(f.cnt[row], obj["cnt"], name + " - cnt")
+            self.assertEquals(f.stamp[row], obj["stamp"], name + " - stamp")
+            self.assertTrue(np.allclose(f.pos[row], obj["pos"]), name + " - position")
+            self.assertEquals(f.confirmed()[row], obj["cnt"] >= f.min_cnt, name + " - confirmed")
+
+            # the original filter normalized the quaternion only when publishing
+            q = ListObjectFilter.normalize(obj["ori"])
+            self.assertAlmostEquals(abs(np.dot(f.ori[row], q)), 1.0, 4, name + " - orientation")
+            self.assertAlmostEquals(np.linalg.norm(f.ori[row]), 1.0, 6, name + " - normalized")
+
+    def test_update(self):
+
+        f = ObjectFilter()
+        ref = ListObjectFilter()
+
+        for (i, (ids, types, pos, ori)) in enumerate(self.random_messages(50, ["A", "B", "C", "D"])):
+
+            ref.update(ids, types, pos.copy(), ori.copy(), float(i))
+            f.update(ids, types, pos.copy(), ori.copy(), float(i))
+
+        self.assert_same(f, ref, "update")
+
+    def test_prune(self):
+
+        f = ObjectFilter()
+        ref = ListObjectFilter()
+        ids = ["obj" + str(i) for i in range(0, 100)]  # more than the initial capacity
+
+        for (i, (msg_ids, types, pos, ori)) in enumerate(self.random_messages(20, ids)):
+
+            # some objects disappear after a while
+            keep = [j for j in range(0, len(msg_ids)) if i < 10 or int(msg_ids[j][3:]) % 3 != 0]
+            msg_ids = [msg_ids[j] for j in keep]
+            types = [types[j] for j in keep]
+
+            ref.update(msg_ids, types, pos[keep], ori[keep], float(i))
+            f.update(msg_ids, types, pos[keep], ori[keep], float(i))
+
+            if i == 15:
+
+                self.assertEquals(sorted(f.prune(float(i), 3.0)), sorted(ref.prune(float(i), 3.0)), "prune - pruned ids")
+                self.assert_same(f, ref, "prune - after pruning")
+
+        # remaining rows are still updated correctly
+        self.assert_same(f, ref, "prune")
+
+    def test_quaternion(self):
+
+        f = ObjectFilter(ao=0.5)
+        q = np.array([[0.0, 0.0, 0.38268343, 0.92387953]])  # 45 deg around z
+
+        # quaternions are normalized
+        f.update(["A"], ["profile"], np.zeros((1, 3)), 2.0 * q, 0.0)
+        self.assertTrue(np.allclose(f.ori[0], q[0]), "quaternion - normalized")
+
+        # average of 45 and 135 deg rotations around z is 90 deg, even if the latter is given as -q (the same rotation)
+        f.update(["A"], ["profile"], np.zeros((1, 3)), np.array([[0.0, 0.0, -0.92387953, -0.38268343]]), 1.0)
+        self.assertTrue(np.allclose(f.ori[0], [0.0, 0.0, 0.70710678, 0.70710678]), "quaternion - average")
+
+    def test_associate_order(self):
+
+        pos = {"A": [0.0, 0.0, 0.0], "B": [0.05, 0.0, 0.0]}
+
+        for ids in [["A", "B"], ["B", "A"]]:
+
+            res = self.f.associate(ids, ["profile"] * 2, np.array([pos[i] for i in ids]), 0.1, 0.1, 1.0)
+            self.assertEquals(res, ids, "associate_order " + str(ids))
+
+    def test_associate_other_id(self):
+
+        # another camera reports the same object under a different id
+        res = self.f.associate(["X"], ["profile"], np.array([[0.02, 0.0, 0.0]]), 0.1, 0.1, 1.0)
+        self.assertEquals(res, ["A"], "associate_other_id")
+
+    def test_associate_type(self):
+
+        res = self.f.associate(["X"], ["other"], np.array([[0.02, 0.0, 0.0]]), 0.1, 0.1, 1.0)
+        self.assertEquals(res, ["X"], "associate_type")
+
+    def test_associate_outlier(self):
+
+        res = self.f.associate(["A"], ["profile"], np.array([[1.0, 0.0, 0.0]]), 0.5, 0.1, 1.0)
+        self.assertEquals(res, [None], "associate_outlier")
+
+        res = self.f.associate(["A"], ["profile"], np.array([[1.0, 0.0, 0.0]]), 2.0, 0.1, 1.0)
+        self.assertEquals(res, ["A"], "associate_reassign")
+
+if __name__ == '__main__':
+
+    rospy.init_node('test_node')
+    rostest.run('art_simple_tracker', 'test_object_filter', TestObjectFilter, sys.argv)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+import rospy
+import rostest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from tracker import TransformCache  # noqa
+
+
+class TestTransformCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.cache = TransformCache(3)
+
+    def test_equal_stamps(self):
+
+        self.cache.put("kinect", rospy.Time(10, 500), "t1")
+
+        # different instance of the same stamp (e.g. deserialized from another message)
+        self.assertEquals(self.cache.get("kinect", rospy.Time(10, 500)), "t1", "equal_stamps - hit")
+        self.assertEquals(self.cache.get("kinect", rospy.Time(10, 501)), None, "equal_stamps - other stamp")
+        self.assertEquals(self.cache.get("camera", rospy.Time(10, 500)), None, "equal_stamps - other frame")
+
+        self.cache.put("kinect", rospy.Time(10, 500), "t2")
+        self.assertEquals(len(self.cache), 1, "equal_stamps - one entry")
+
+    def test_size(self):
+
+        for i in range(0, 10):
+            self.cache.put("kinect", rospy.Time(i), i)
+
+        self.assertEquals(len(self.cache), 3, "size - bounded")
+        self.assertEquals(self.cache.get("kinect", rospy.Time(6)), None, "size - evicted")
+        self.assertEquals(self.cache.get("kinect", rospy.Time(9)), 9, "size - kept")
+
+    def test_lru(self):
+
+        for i in range(0, 3):
+            self.cache.put("kinect", rospy.Time(i), i)
+
+        self.cache.get("kinect", rospy.Time(0))  # 1 is now the least recently used
+        self.cache.put("kinect", rospy.Time(3), 3)
+
+        self.assertEquals(self.cache.get("kinect", rospy.Time(0)), 0, "lru - kept")
+        self.assertEquals(self.cache.get("kinect", rospy.Time(1)), None, "lru - evicted")
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('test_node')
+    rostest.run('art_simple_tracker', 'test_transform_cache', TestTransformCache, sys.argv)
@@ -2,8 +2,12 @@
 
 import rospy
 import numpy as np
-
-import pycopia.OS.Linux.Input as input
+import os
+import glob
+import select
+import errno
+import struct
+import time
 
 from geometry_msgs.msg import PointStamped
 from art_msgs.msg import Touch
@@ -15,6 +19,64 @@ import cv2
 import ast
 
 
+# struct input_event (linux/input.h): struct timeval time, __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct('llHHi')
+
+EV_SYN = 0
+EV_ABS = 3
+
+SYN_REPORT = 0
+SYN_DROPPED = 3
+
+ABS_MT_SLOT = 47
+ABS_MT_POSITION_X = 53
+ABS_MT_POSITION_Y = 54
+ABS_MT_TRACKING_ID = 57
+
+INPUT_PROP_DIRECT = 1  # direct input devices (touch screens), unlike touchpads
+
+
+def has_bits(bitmap, codes):
+    """Checks bits in a bitmap as shown in sysfs (hex words of unsigned long, the most significant first)."""
+
+    bits = struct.calcsize('l') * 8
+    words = [int(w, 16) for w in bitmap.split()][::-1]
+
+    for code in codes:
+
+        if code // bits >= len(words) or not words[code // bits] & (1 << (code % bits)):
+            return False
+
+    return True
+
+
+def find_touch_devices():
+    """Returns list of (device path, name, direct) of all multitouch devices (protocol B - with slots)."""
+
+    devices = []
+
+    for sys_path in sorted(glob.glob('/sys/class/input/event*'), key=lambda p: int(p[len('/sys/class/input/event'):])):
+
+        try:
+
+            with open(os.path.join(sys_path, 'device', 'name')) as f:
+                name = f.read().strip()
+
+            with open(os.path.join(sys_path, 'device', 'capabilities', 'abs')) as f:
+                abs_caps = f.read()
+
+            with open(os.path.join(sys_path, 'device', 'properties')) as f:
+                props = f.read()
+
+        except IOError:
+            continue
+
+        if has_bits(abs_caps, [ABS_MT_SLOT, ABS_MT_POSITION_X, ABS_MT_POSITION_Y, ABS_MT_TRACKING_ID]):
+            devices.append(('/dev/input/' + os.path.basename(sys_path), name, has_bits(props, [INPUT_PROP_DIRECT])))
+
+    return devices
+
+
 class Slot:
 
     def __init__(self, slot_id=None, track_id=None):
@@ -30,11 +92,154 @@ class Slot:
 
         self.x = 0
         self.y = 0
+        self.changed = False  # updated in the current frame
 
     def __eq__(self, other):
         return self.slot_id == other.slot_id
 
 
+class TouchDevice:
+
+    """One evdev multitouch device (touch frame) with its own slots and calibration (homography).
+
+        Slots are kept in a fixed array indexed by slot id, slots changed in the current frame are collected
+        in a list - so processing of each event takes constant time regardless of number of slots.
+
+    """
+
+    def __init__(self, index, path, name, ref_points, max_slots=16, read_batch=64):
+
+        self.index = index
+        self.path = path
+        self.name = name
+        self.ref_points = ref_points
+
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.buffer = ''
+        self.read_size = INPUT_EVENT.size * read_batch
+
+        self.slots = [Slot(slot_id=i) for i in range(0, max_slots)]
+        self.slot = self.slots[0]  # kernel starts with slot 0
+        self.changed = []  # slots changed in the current frame
+        self.ended = []  # track ids of touches which ended in the current frame
+        self.started = []  # slots of touches which started in the current frame
+        self.dropping = False  # events were lost, ignore them until the next SYN_REPORT
+
+        self.h_matrix = None
+
+    def connected(self):
+
+        return self.fd is not None
+
+    def close(self):
+
+        if self.fd is not None:
+
+            os.close(self.fd)
+            self.fd = None
+
+    def read_events(self, frame_cb):
+        """Reads available events, frame_cb(device, stamp) is called for each complete frame.
+
+        Returns False when the device can't be read anymore (e.g. it was unplugged).
+        """
+
+        try:
+            data = os.read(self.fd, self.read_size)
+        except OSError, e:
+
+            if e.errno == errno.EAGAIN:
+                return True
+
+            rospy.logerr("Failed to read from " + self.path + ": " + str(e))
+            return False
+
+        data = self.buffer + data
+        end = len(data) - len(data) % INPUT_EVENT.size
+
+        for off in xrange(0, end, INPUT_EVENT.size):
+
+            (sec, usec, evtype, code, value) = INPUT_EVENT.unpack_from(data, off)
+
+            if evtype == EV_SYN:
+
+                if code == SYN_REPORT:
+
+                    if self.dropping:
+                        self.dropping = False
+                    else:
+                        frame_cb(self, sec + usec * 1e-6)
+
+                elif code == SYN_DROPPED:
+
+                    rospy.logwarn("Touch events dropped (" + self.path + ")")
+                    self.dropping = True
+
+            elif evtype == EV_ABS and not self.dropping:
+
+                self.process_abs(code, value)
+
+        self.buffer = data[end:]
+        return True
+
+    def mark_changed(self, slot):
+
+        if not slot.changed:
+
+            slot.changed = True
+            self.changed.append(slot)
+
+    def process_abs(self, code, value):
+
+        if code == ABS_MT_SLOT:
+
+            if 0 <= value < len(self.slots):
+                self.slot = self.slots[value]
+            else:
+                rospy.logwarn("Slot " + str(value) + " out of range (" + self.path + "), increase max_slots")
+                self.slot = None
+
+        elif self.slot is None:
+
+            return
+
+        elif code == ABS_MT_TRACKING_ID:
+
+            if value >= 0:
+
+                # touch start
+                self.slot.track_id = value
+                self.mark_changed(self.slot)
+                self.started.append(self.slot)
+
+            else:
+
+                # touch end
+                if self.slot.track_id >= 0:
+                    self.ended.append(self.slot.track_id)
+
+                self.slot.track_id = -1
+
+        elif code == ABS_MT_POSITION_X:
+
+            self.slot.x = value
+            self.mark_changed(self.slot)
+
+        elif code == ABS_MT_POSITION_Y:
+
+            self.slot.y = value
+            self.mark_changed(self.slot)
+
+    def end_frame(self):
+
+        for slot in self.changed:
+            slot.changed = False
+
+        del self.changed[:]
+        del self.ended[:]
+        del self.started[:]
+
+
 class ArtTouchDriver:
 
     def __init__(self):
@@ -42,11 +247,24 @@ class ArtTouchDriver:
         self.y = 0
         self.touch = False
         self.touch_id = -1
-        self.device = input.EventDevice("/dev/input/event17")
 
-        self.slots = []
-        self.slot = None
-        self.to_delete_id = -1
+        self.devices = []
+
+        for (path, name, ref_points) in self.get_devices_config():
+
+            device = TouchDevice(len(self.devices), path, name, ref_points, rospy.get_param('~max_slots', 16), rospy.get_param('~read_batch', 64))
+            self.devices.append(device)
+            rospy.loginfo("Using touch device: " + path + " (" + name + ")")
+
+        if len(self.devices) == 0:
+            rospy.logerr("No touch device found")
+
+        # latency from kernel timestamp of SYN_REPORT to publishing of touches
+        self.stats_period = rospy.get_param('~stats_period', 10.0)
+        self.stats_start = time.time()
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.frames = 0
 
         self.ns = '/art/interface/touchtable/'
 
@@ -58,15 +276,94 @@ class ArtTouchDriver:
 
         self.calib_srv = rospy.ServiceProxy('/art/interface/projected_gui/touch_calibration', TouchCalibrationPoints)
 
+        self.calib_device = None  # devices are calibrated one by one
         self.set_calibrated(False)
         self.set_calibrating(False)
 
-        self.h_matrix = rospy.get_param('~calibration_matrix', None)
+        for device in self.devices:
 
-        if self.h_matrix is not None:
-            rospy.loginfo("Loaded calibration from param server")
-            self.h_matrix = np.matrix(ast.literal_eval(self.h_matrix))
-            self.set_calibrated(True)
+            h_matrix = rospy.get_param(self.calibration_param(device), None)
+
+            if h_matrix is not None:
+                rospy.loginfo("Loaded calibration of " + device.path + " from param server")
+                device.h_matrix = np.matrix(ast.literal_eval(h_matrix))
+
+        self.set_calibrated(self.all_calibrated())
+
+    @staticmethod
+    def get_devices_config():
+        """Returns list of (device path, name, calibration reference points).
+
+        Devices are given by ~devices parameter (list of dictionaries with 'path' or 'name' and optional 'ref_points'),
+        by ~device parameter (path) or all direct multitouch devices (touch screens, not touchpads) are used.
+        """
+
+        default_ref_points = ((0.4, 0.1), (1.0, 0.1), (0.4, 0.5), (1.0, 0.5))
+
+        found = find_touch_devices()
+        names = dict((path, name) for (path, name, direct) in found)
+
+        config = rospy.get_param('~devices', None)
+
+        if config is None:
+
+            if rospy.has_param('~device'):
+                config = [{'path': rospy.get_param('~device')}]
+            else:
+                config = [{'path': path} for (path, name, direct) in found if direct]
+
+        devices = []
+
+        for cfg in config:
+
+            if not isinstance(cfg, dict) or ('path' not in cfg and 'name' not in cfg):
+
+                rospy.logerr("Touch device config " + str(cfg) + " has neither 'path' nor 'name', ignoring it")
+                continue
+
+            ref_points = [tuple(pt) for pt in cfg.get('ref_points', default_ref_points)]
+
+            if 'path' in cfg:
+
+                devices.append((cfg['path'], names.get(cfg['path'], ''), ref_points))
+                continue
+
+            # several identical frames have the same name - take the first one not used yet
+            for (path, name, direct) in found:
+
+                if cfg['name'] in name and path not in [d[0] for d in devices]:
+
+                    devices.append((path, name, ref_points))
+                    break
+
+            else:
+
+                rospy.logerr("Touch device '" + cfg['name'] + "' not found")
+
+        return devices
+
+    @staticmethod
+    def calibration_param(device):
+
+        if device.index == 0:
+            return "~calibration_matrix"
+
+        return "~calibration_matrix_" + str(device.index)
+
+    def all_calibrated(self):
+
+        connected = [device for device in self.devices if device.connected()]
+        return len(connected) > 0 and all(device.h_matrix is not None for device in connected)
+
+    def next_device(self, index=-1):
+        """Returns the first connected device after the given index (or None)."""
+
+        for device in self.devices[index + 1:]:
+
+            if device.connected():
+                return device
+
+        return None
 
     def set_calibrated(self, state):
 
@@ -82,15 +379,22 @@ class ArtTouchDriver:
 
         rospy.wait_for_service('/art/interface/projected_gui/touch_calibration')  # TODO wait in __init__??
 
+        device = self.next_device()
+
+        if device is not None:
+            self.start_calibration(device)
+
+        return EmptyResponse()
+
+    def start_calibration(self, device):
+
         req = TouchCalibrationPointsRequest()
         ps = PointStamped()
         ps.header.stamp = rospy.Time.now()
         ps.header.frame_id = "marker"
         ps.point.z = 0
 
-        self.ref_points = ((0.4, 0.1), (1.0, 0.1), (0.4, 0.5), (1.0, 0.5))
-
-        for pt in self.ref_points:
+        for pt in device.ref_points:
 
             ps.point.x = pt[0]
             ps.point.y = pt[1]
@@ -100,122 +404,169 @@ class ArtTouchDriver:
             resp = self.calib_srv(req)
         except rospy.ServiceException, e:
             print "Service call failed: %s" % e
+            self.calib_device = None
             self.set_calibrating(False)
-            return EmptyResponse()
+            return
 
         if resp.success:
 
             self.touch_cnt = 0
             self.calib_points = []
+            self.calib_device = device
             self.set_calibrating(True)
-            rospy.loginfo('Starting calibration')
+            rospy.loginfo('Starting calibration of ' + device.path)
 
         else:
 
+            self.calib_device = None
             self.set_calibrating(False)
             rospy.logerr('Failed to start calibration')
 
-        return EmptyResponse()
+    def run(self):
+        """Blocks on all devices (without spinning), processes available events in batches."""
 
-    def get_slot_by_id(self, slot_id):
-        for slot in self.slots:
-            if slot.slot_id == slot_id:
-                return slot
-        return None
+        poller = select.epoll()
+        fds = {}
 
-    def process(self):
-        # print 1 if self.device._eventq else 0
-        event = self.device.read()
-        while True:
-            if event.evtype == 3 and event.code == 47 and event.value >= 0:
-                # MT_SLOT
-                self.slot = self.get_slot_by_id(event.value)
-                if self.slot is None:
-                    self.slot = Slot(slot_id=event.value)
-                    self.slots.append(self.slot)
-
-            elif event.evtype == 3 and event.code == 57 and event.value >= 0:
-                # MT_TRACK_ID start
-                if self.slot is None:
-                    self.slot = Slot(track_id=event.value, slot_id=0)
-                    self.slots.append(self.slot)
-                else:
-                    self.slot.track_id = event.value
-
-            elif event.evtype == 3 and event.code == 57 and event.value < 0:
-                # MT_TRACK_ID end
-                if self.slot is not None:
-                    self.to_delete_id = self.slot.track_id
-                    self.slots.remove(self.slot)
-                    self.slot = None
-
-            elif event.evtype == 3 and event.code == 53:
-                # x position
-                self.slot.x = event.value
-
-            elif event.evtype == 3 and event.code == 54:
-                # y position
-                self.slot.y = event.value
-
-            elif event.evtype == 0:
-
-                touch = Touch()
-                if self.slot is None:
-                    touch.id = self.to_delete_id
-                    touch.touch = False
-                else:
-                    touch.touch = True
-                    touch.id = self.slot.track_id
-                    touch.point = PointStamped()
-
-                    if self.calibrated:
-
-                        pt = [self.slot.x, self.slot.y, 1]
-
-                        pt = self.h_matrix.dot(np.array(pt, dtype='float64')).tolist()
-                        # print pt
-                        touch.point.point.x = pt[0][0]
-                        touch.point.point.y = pt[0][1]
-
-                    if self.calibrating:
-
-                        # TODO check for "double click" (calc distance from prev touch?)
-                        if self.touch_cnt < 4:
-
-                            self.calib_points.append((self.slot.x,  self.slot.y))
-                            self.touch_det_pub.publish()
-                            self.touch_cnt += 1
-
-                            if self.touch_cnt == 4:
-
-                                self.calculate_calibration()
-                                self.set_calibrating(False)
-
-                if self.calibrated:
-                    self.touch_pub.publish(touch)
+        for device in self.devices:
 
+            poller.register(device.fd, select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR)
+            fds[device.fd] = device
+
+        try:
+
+            while not rospy.is_shutdown():
+
+                # timeout only to notice shutdown
+                for (fd, mask) in poller.poll(0.5):
+
+                    device = fds[fd]
+
+                    if mask & select.EPOLLIN and not device.read_events(self.process_frame):
+                        self.disconnect(poller, fds, device)
+                    elif mask & (select.EPOLLHUP | select.EPOLLERR):
+                        self.disconnect(poller, fds, device)
+
+        finally:
+
+            poller.close()
+
+            for device in self.devices:
+                device.close()
+
+    def disconnect(self, poller, fds, device):
+        """Stops polling of a device which can't be read anymore, the other devices keep working."""
+
+        rospy.logerr("Touch device " + device.path + " disconnected")
+
+        poller.unregister(device.fd)
+        del fds[device.fd]
+        device.close()
+
+        if device is self.calib_device:
+
+            self.calib_device = None
+            self.set_calibrating(False)
+
+        self.set_calibrated(self.all_calibrated())
+
+    def merged_id(self, device, track_id):
+
+        # track ids are unique per device only
+        return track_id * len(self.devices) + device.index
+
+    def process_frame(self, device, stamp):
+        """Publishes all touches changed in a complete frame (terminated by SYN_REPORT) of the device."""
+
+        if self.calibrating and device is self.calib_device:
+
+            # position is known at the end of the frame
+            for slot in device.started:
+                self.calibration_touch(device, slot)
+
+        if device.h_matrix is None:
+
+            device.end_frame()
+            return
+
+        for track_id in device.ended:
+
+            touch = Touch()
+            touch.id = self.merged_id(device, track_id)
+            touch.touch = False
+            touch.point.header.stamp = rospy.Time.from_sec(stamp)
+            self.touch_pub.publish(touch)
+
+        for slot in device.changed:
+
+            if slot.track_id < 0:
+                continue
+
+            touch = Touch()
+            touch.touch = True
+            touch.id = self.merged_id(device, slot.track_id)
+            touch.point.header.stamp = rospy.Time.from_sec(stamp)
+
+            pt = device.h_matrix.dot(np.array([slot.x, slot.y, 1], dtype='float64')).tolist()
+            touch.point.point.x = pt[0][0]
+            touch.point.point.y = pt[0][1]
+
+            self.touch_pub.publish(touch)
+
+        device.end_frame()
+        self.update_stats(stamp)
+
+    def calibration_touch(self, device, slot):
+
+        # TODO check for "double click" (calc distance from prev touch?)
+        if self.touch_cnt >= 4:
+            return
+
+        self.calib_points.append((slot.x, slot.y))
+        self.touch_det_pub.publish()
+        self.touch_cnt += 1
+
+        if self.touch_cnt == 4:
+
+            self.calculate_calibration(device)
+
+            next_device = self.next_device(device.index)
+
+            if next_device is not None:
+                self.start_calibration(next_device)
             else:
-                pass
-            # print event
+                self.calib_device = None
+                self.set_calibrating(False)
+
+    def update_stats(self, stamp):
+
+        # kernel timestamps events using CLOCK_REALTIME
+        now = time.time()
+        latency = now - stamp
 
-            if not self.device._eventq:
-                break
-            event = self.device.read()
+        self.frames += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
 
-    def calculate_calibration(self):
+        if now - self.stats_start < self.stats_period:
+            return
 
-        # print self.calib_points
-        # print self.ref_points
+        rospy.loginfo("Touch frames: %d, latency avg: %.2f ms, max: %.2f ms" % (self.frames, 1000.0 * self.latency_sum / self.frames, 1000.0 * self.latency_max))
 
-        h, status = cv2.findHomography(np.array(self.calib_points, dtype='float64'), np.array(self.ref_points, dtype='float64'))
-        self.h_matrix = np.matrix(h)
+        self.stats_start = now
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.frames = 0
 
-        s = str(self.h_matrix.tolist())
-        rospy.set_param("~calibration_matrix", s)
+    def calculate_calibration(self, device):
 
-        # print self.h_matrix
+        h, status = cv2.findHomography(np.array(self.calib_points, dtype='float64'), np.array(device.ref_points, dtype='float64'))
+        device.h_matrix = np.matrix(h)
 
-        self.set_calibrated(True)
+        s = str(device.h_matrix.tolist())
+        rospy.set_param(self.calibration_param(device), s)
+
+        self.set_calibrated(self.all_calibrated())
 
 if __name__ == '__main__':
     rospy.init_node('art_touch_driver')
@@ -226,10 +577,6 @@ if __name__ == '__main__':
 
     try:
         node = ArtTouchDriver()
-        rate = rospy.Rate(1000)
-
-        while not rospy.is_shutdown():
-            node.process()
-            # rate.sleep()
+        node.run()
     except rospy.ROSInterruptException:
         pass
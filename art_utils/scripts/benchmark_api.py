@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import rospy
+import sys
+import time
+from art_utils import ArtApiHelper
+
+# compares latency of ArtApiHelper calls with plain, persistent and asynchronous (persistent) service calls
+# art_db has to be running
+
+
+def measure(fn, cnt):
+
+    start = time.time()
+
+    for i in range(0, cnt):
+        fn()
+
+    return (time.time() - start) / cnt * 1000.0
+
+
+def main(args):
+
+    cnt = 200
+
+    if len(args) > 1:
+        cnt = int(args[1])
+
+    rospy.init_node('benchmark_api', anonymous=True)
+
+    plain = ArtApiHelper(brain=True)
+    persistent = ArtApiHelper(brain=True, persistent=True)
+
+    plain.wait_for_api()
+    persistent.wait_for_api()
+
+    print "Calls: " + str(cnt)
+    print "plain get_program_headers: %.3f ms per call" % measure(plain.get_program_headers, cnt)
+    print "persistent get_program_headers: %.3f ms per call" % measure(persistent.get_program_headers, cnt)
+
+    # caller is blocked only while the calls are queued
+    start = time.time()
+    futures = [persistent.get_program_headers_async() for i in range(0, cnt)]
+    queued = time.time() - start
+
+    for f in futures:
+        f.result()
+
+    done = time.time() - start
+
+    print "async get_program_headers: %.3f ms per call (caller blocked for %.3f ms in total)" % (done / cnt * 1000.0, queued * 1000.0)
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv)
+    except KeyboardInterrupt:
+        print("Shutting down")
@@ -2,3 +2,5 @@ from program_helper import ProgramHelper
 from art_api_helper import ArtApiHelper
 from interface_state_manager import InterfaceStateManager
 from calibration_helper import ArtCalibrationHelper
+from cache import ArtCache
+from program_analyzer import ProgramAnalyzer
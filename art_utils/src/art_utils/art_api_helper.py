@@ -1,25 +1,140 @@
 #!/usr/bin/env python
 
 import rospy
+import threading
+import Queue
 from art_msgs.srv import getProgram, storeProgram, startProgram, getObjectType,  getProgramHeaders
+from std_msgs.msg import String
+from cache import ArtCache
 
 # TODO make brain version a new class (based on ArtApiHelper)
 
 
+class ArtServiceProxy():
+
+    """Wrapper around rospy.ServiceProxy.
+
+        Persistent proxy keeps the connection open between calls (calls are serialized as the connection
+        can't be shared) and reconnects (and repeats the call once) when the connection is lost.
+
+    """
+
+    def __init__(self, name, service_class, persistent=False):
+
+        self.name = name
+        self.service_class = service_class
+        self.persistent = persistent
+
+        self._lock = threading.Lock()
+        self._proxy = self._create_proxy()
+
+    def _create_proxy(self):
+
+        return rospy.ServiceProxy(self.name, self.service_class, persistent=self.persistent)
+
+    def wait_for_service(self, timeout=None):
+
+        self._proxy.wait_for_service(timeout)
+
+    def __call__(self, *args, **kwargs):
+
+        if not self.persistent:
+            return self._proxy(*args, **kwargs)
+
+        with self._lock:
+
+            try:
+                return self._proxy(*args, **kwargs)
+            except rospy.ServiceException:
+
+                rospy.logwarn("Connection to " + self.name + " lost, reconnecting.")
+                self._proxy.close()
+                self._proxy = self._create_proxy()
+                return self._proxy(*args, **kwargs)
+
+
+class ArtApiFuture():
+
+    """Result of an asynchronous ArtApiHelper call."""
+
+    def __init__(self):
+
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._callbacks = []
+
+    def done(self):
+
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the call to finish and returns the same value as the synchronous variant (None on timeout)."""
+
+        self._event.wait(timeout)
+        return self._result
+
+    def add_done_callback(self, cb):
+        """Callback gets the future as an argument. It's called from the worker thread (or immediately if done)."""
+
+        with self._lock:
+
+            if not self._event.is_set():
+                self._callbacks.append(cb)
+                return
+
+        cb(self)
+
+    def set_result(self, result):
+
+        with self._lock:
+
+            self._result = result
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+
+        for cb in callbacks:
+            cb(self)
+
+
 class ArtApiHelper():
 
-    def __init__(self,  brain=False):
+    def __init__(self,  brain=False, object_type_cache_size=100, object_type_cache_ttl=60.0, persistent=False):
+
+        self.persistent = persistent
 
         # DB API
-        self.get_prog_srv = rospy.ServiceProxy('/art/db/program/get', getProgram)
-        self.store_prog_srv = rospy.ServiceProxy('/art/db/program/store', storeProgram)
-        self.get_program_headers_srv = rospy.ServiceProxy('/art/db/program_headers/get', getProgramHeaders)
-        self.get_obj_type_srv = rospy.ServiceProxy('/art/db/object_type/get', getObjectType)
+        self.get_prog_srv = ArtServiceProxy('/art/db/program/get', getProgram, persistent)
+        self.store_prog_srv = ArtServiceProxy('/art/db/program/store', storeProgram, persistent)
+        self.get_program_headers_srv = ArtServiceProxy('/art/db/program_headers/get', getProgramHeaders, persistent)
+        self.get_obj_type_srv = ArtServiceProxy('/art/db/object_type/get', getObjectType, persistent)
+        self.get_obj_types_srv = self._create_obj_types_srv(persistent)
+
+        # asynchronous calls are processed one by one in a worker thread (started on first use)
+        self._async_queue = Queue.Queue()
+        self._async_thread = None
+        self._async_lock = threading.Lock()
+
+        # object types are cached, art_db announces changed types so stale entries are dropped immediately
+        self.object_type_cache = ArtCache(object_type_cache_size, object_type_cache_ttl)
+        self.object_type_invalidate_sub = rospy.Subscriber('/art/db/object_type/invalidate', String, self.object_type_invalidate_cb)
 
         # Brain API
         self.brain = brain
         if not self.brain:
-            self.start_program_srv = rospy.ServiceProxy('/art/brain/program/start', startProgram)
+            self.start_program_srv = ArtServiceProxy('/art/brain/program/start', startProgram, persistent)
+
+    @staticmethod
+    def _create_obj_types_srv(persistent):
+
+        # batch lookup needs getObjectTypes, which older art_msgs don't have - per-type calls are used then
+        try:
+            from art_msgs.srv import getObjectTypes
+        except ImportError:
+            return None
+
+        return ArtServiceProxy('/art/db/object_types/get', getObjectTypes, persistent)
 
     def wait_for_api(self):
 
@@ -31,6 +146,53 @@ class ArtApiHelper():
         if not self.brain:
             self.start_program_srv.wait_for_service()
 
+    def _async_worker(self):
+
+        while not rospy.is_shutdown():
+
+            try:
+                (future, fn, args) = self._async_queue.get(timeout=1.0)
+            except Queue.Empty:
+                continue
+
+            try:
+                res = fn(*args)
+            except Exception, e:
+                rospy.logerr("Asynchronous call failed: " + str(e))
+                res = None
+
+            future.set_result(res)
+
+    def _call_async(self, fn, *args):
+
+        with self._async_lock:
+
+            if self._async_thread is None:
+
+                self._async_thread = threading.Thread(target=self._async_worker)
+                self._async_thread.daemon = True
+                self._async_thread.start()
+
+        future = ArtApiFuture()
+        self._async_queue.put((future, fn, args))
+        return future
+
+    def load_program_async(self, prog_id):
+
+        return self._call_async(self.load_program, prog_id)
+
+    def get_program_headers_async(self, ids=[]):
+
+        return self._call_async(self.get_program_headers, ids)
+
+    def store_program_async(self, prog):
+
+        return self._call_async(self.store_program, prog)
+
+    def get_object_type_async(self, name):
+
+        return self._call_async(self.get_object_type, name)
+
     def load_program(self, prog_id):
 
         rospy.loginfo('Loading program: ' + str(prog_id))
@@ -82,14 +244,77 @@ class ArtApiHelper():
         else:
             return True
 
+    def object_type_invalidate_cb(self, msg):
+
+        self.object_type_cache.invalidate(msg.data)
+
     def get_object_type(self, name):
 
+        object_type = self.object_type_cache.get(name)
+
+        if object_type is not None:
+            return object_type
+
+        version = self.object_type_cache.version(name)
+
         try:
             resp = self.get_obj_type_srv(name)
         except rospy.ServiceException, e:
             print "Service call failed: %s" % e
+            return None
 
         if not resp.success:
             return None
         else:
+            self.object_type_cache.put(name, resp.object_type, version)
             return resp.object_type
+
+    def get_object_types(self, names):
+        """Resolves several object types using one service call (only types which are not cached are requested).
+
+        Returns dictionary (name -> ObjectType, None for unknown types) or None if the call failed.
+        Falls back to one call per type when the batch service is not available.
+        """
+
+        types = {}
+        missing = []
+
+        for name in set(names):
+
+            object_type = self.object_type_cache.get(name)
+
+            if object_type is not None:
+                types[name] = object_type
+            else:
+                missing.append(name)
+
+        if len(missing) == 0:
+            return types
+
+        if self.get_obj_types_srv is None:
+
+            for name in missing:
+                types[name] = self.get_object_type(name)
+
+            return types
+
+        versions = [self.object_type_cache.version(name) for name in missing]
+
+        try:
+            resp = self.get_obj_types_srv(missing)
+        except rospy.ServiceException, e:
+
+            # art_db without the batch service
+            rospy.logwarn("Batch object type lookup failed (%s), using per-type calls" % e)
+            self.get_obj_types_srv = None
+            return self.get_object_types(names)
+
+        for (name, version, object_type) in zip(missing, versions, resp.object_types):
+
+            if object_type.name == "":
+                types[name] = None
+            else:
+                types[name] = object_type
+                self.object_type_cache.put(name, object_type, version)
+
+        return types
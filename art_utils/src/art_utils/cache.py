@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ArtCache():
+
+    """ArtCache is a bounded, thread-safe key-value cache with LRU eviction and optional TTL.
+
+        Each key has a version which is increased whenever the key is stored or invalidated. A reader which
+        misses the cache can remember the version, fetch the value elsewhere and store it only if nobody
+        changed the key in the meantime (so slow reads can't overwrite fresh writes).
+
+        Entries older than ttl (seconds, None means forever) are treated as missing. TTL can be also set per entry.
+        Use get() with a default to tell a missing key from a stored None.
+
+    """
+
+    def __init__(self, max_size=100, ttl=None):
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._data = OrderedDict()  # key -> (value, expiration time or None)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+
+        with self._lock:
+
+            if key not in self._data:
+
+                self.misses += 1
+                return default
+
+            (value, expires) = self._data.pop(key)
+
+            if expires is not None and time.time() > expires:
+
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data[key] = (value, expires)  # move to the end (most recently used)
+            self.hits += 1
+            return value
+
+    def version(self, key):
+
+        with self._lock:
+
+            return self._versions.get(key, 0)
+
+    def put(self, key, value, version=None, ttl=None):
+        """Stores value. If version is given, the value is stored only when the key was not changed since then."""
+
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+
+            if version is not None and self._versions.get(key, 0) != version:
+                return False
+
+            if key in self._data:
+                del self._data[key]
+
+            if ttl is not None:
+                self._data[key] = (value, time.time() + ttl)
+            else:
+                self._data[key] = (value, None)
+
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+            while len(self._data) > self.max_size:
+
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+            return True
+
+    def invalidate(self, key):
+
+        with self._lock:
+
+            if key in self._data:
+                del self._data[key]
+
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self):
+
+        with self._lock:
+
+            self._data.clear()
+
+            for key in self._versions:
+                self._versions[key] += 1
+
+    def __len__(self):
+
+        return len(self._data)
+
+    def __contains__(self, key):
+
+        with self._lock:
+
+            if key not in self._data:
+                return False
+
+            expires = self._data[key][1]
+            return expires is None or time.time() <= expires
+
+    def get_stats(self):
+
+        with self._lock:
+
+            return {"size": len(self._data), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations}
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+from collections import deque
+from art_msgs.msg import ProgramItem
+from program_helper import ProgramHelper
+
+
+class ProgramAnalyzer():
+
+    """ProgramAnalyzer does static analysis of a program loaded into ProgramHelper.
+
+        Items are nodes of a graph, edges are their on_success / on_failure transitions (incl. jumps between blocks).
+        Analysis finds:
+            - items / blocks which can't be reached from the first item (warnings),
+            - reachable items from which the end of the program can't be reached - infinite loops (errors),
+            - PLACE_TO_POSE items referencing a pick which can never run before them (errors).
+
+        It also estimates number of robot actions (see ACTION_COST) - following on_success transitions only
+        and the minimal / maximal number of actions needed to get to the end of the program.
+
+    """
+
+    # estimated number of robot actions per item type, waiting for user costs nothing
+    ACTION_COST = {ProgramItem.GET_READY: 1, ProgramItem.WAIT_FOR_USER: 0, ProgramItem.WAIT_UNTIL_USER_FINISHES: 0,
+                   ProgramItem.PICK_FROM_POLYGON: 1, ProgramItem.PICK_FROM_FEEDER: 1, ProgramItem.PICK_OBJECT_ID: 1,
+                   ProgramItem.PLACE_TO_POSE: 1}
+
+    PICK_TYPES = [ProgramItem.PICK_FROM_POLYGON, ProgramItem.PICK_FROM_FEEDER, ProgramItem.PICK_OBJECT_ID]
+
+    def __init__(self, ph=None):
+
+        if ph is None:
+            ph = ProgramHelper()
+
+        self.ph = ph
+        self._reset()
+
+    def _reset(self):
+
+        self.errors = []
+        self.warnings = []
+
+        self.unreachable_items = []  # list of (block id, item id)
+        self.unreachable_blocks = []
+        self.loop_items = []  # reachable items without way to the end
+
+        self.success_path = []  # list of (block id, item id) following on_success from the first item
+        self.success_path_loops = False
+        self.success_path_actions = 0
+        self.min_actions = None  # None if the end is not reachable
+        self.max_actions = None  # None if there is a reachable cycle
+
+    def analyze(self, prog=None, template=False):
+        """Analyzes given program (or the one already loaded in ProgramHelper). Returns True if there are no errors."""
+
+        self._reset()
+
+        if prog is not None and not self.ph.load(prog, template):
+
+            self.errors.append("Invalid program")
+            return False
+
+        ph = self.ph
+
+        keys = []  # node -> (block id, item id)
+        nodes = {}  # (block id, item id) -> node
+
+        for block_id in ph.get_block_ids():
+            for item_id in ph.get_items_ids(block_id):
+
+                nodes[(block_id, item_id)] = len(keys)
+                keys.append((block_id, item_id))
+
+        end = len(keys)  # virtual node for the end of the program
+        succ = [None] * end
+        preds = [[] for i in range(0, end + 1)]
+
+        for n in range(0, end):
+
+            s = nodes.get(ph.get_id_on_success(*keys[n]), end)
+            f = nodes.get(ph.get_id_on_failure(*keys[n]), end)
+            succ[n] = (s, f)
+
+            preds[s].append(n)
+            if f != s:
+                preds[f].append(n)
+
+        cost = [self.ACTION_COST.get(ph.get_item_type(*key), 1) for key in keys]
+        first = nodes[ph.get_first_item_id()]
+
+        reachable = self._search(first, lambda n: succ[n] if n != end else ())
+        exits = self._search(end, lambda n: preds[n])
+
+        for block_id in ph.get_block_ids():
+
+            block_reachable = False
+
+            for item_id in ph.get_items_ids(block_id):
+
+                if nodes[(block_id, item_id)] in reachable:
+                    block_reachable = True
+                else:
+                    self.unreachable_items.append((block_id, item_id))
+
+            if not block_reachable:
+
+                self.unreachable_blocks.append(block_id)
+                self.warnings.append("Block id: " + str(block_id) + " is unreachable")
+
+        for key in self.unreachable_items:
+
+            if key[0] not in self.unreachable_blocks:
+                self.warnings.append("Block id: " + str(key[0]) + ", item id: " + str(key[1]) + " is unreachable")
+
+        for n in range(0, end):
+
+            if n in reachable and n not in exits:
+
+                self.loop_items.append(keys[n])
+                self.errors.append("Block id: " + str(keys[n][0]) + ", item id: " + str(keys[n][1]) + " can't reach end of the program (infinite loop)")
+
+        # place may run only if some of referenced picks can run before it
+        for n in range(0, end):
+
+            if n not in reachable:
+                continue
+
+            msg = ph.get_item_msg(*keys[n])
+
+            if msg.type != ProgramItem.PLACE_TO_POSE:
+                continue
+
+            ancestors = None
+
+            for ref in msg.ref_id:
+
+                r = nodes[(keys[n][0], ref)]
+
+                if ph.get_item_type(*keys[r]) not in self.PICK_TYPES:
+
+                    self.errors.append("Block id: " + str(keys[n][0]) + ", item id: " + str(keys[n][1]) + " references item " + str(ref) + " which is not a pick")
+                    continue
+
+                if ancestors is None:
+                    ancestors = self._search(n, lambda m: preds[m], False)
+
+                if r not in reachable or r not in ancestors:
+
+                    self.errors.append("Block id: " + str(keys[n][0]) + ", item id: " + str(keys[n][1]) + " references item " + str(ref) + " which can't run before it")
+
+        # follow on_success transitions
+        visited = set()
+        n = first
+
+        while n != end:
+
+            if n in visited:
+
+                self.success_path_loops = True
+                break
+
+            visited.add(n)
+            self.success_path.append(keys[n])
+            self.success_path_actions += cost[n]
+            n = succ[n][0]
+
+        self.min_actions = self._min_actions(first, end, succ, cost)
+        self.max_actions = self._max_actions(first, end, succ, cost)
+
+        return len(self.errors) == 0
+
+    def is_valid(self):
+
+        return len(self.errors) == 0
+
+    @staticmethod
+    def _search(start, neighbours, include_start=True):
+
+        visited = set()
+        queue = deque([start])
+
+        if include_start:
+            visited.add(start)
+
+        while queue:
+
+            n = queue.popleft()
+
+            for m in neighbours(n):
+
+                if m not in visited:
+
+                    visited.add(m)
+                    queue.append(m)
+
+        return visited
+
+    @staticmethod
+    def _min_actions(first, end, succ, cost):
+
+        # 0-1 BFS (each item costs zero or one action)
+        dist = {first: cost[first]}
+        queue = deque([first])
+
+        while queue:
+
+            n = queue.popleft()
+
+            if n == end:
+                continue
+
+            for m in set(succ[n]):
+
+                d = dist[n] + (cost[m] if m != end else 0)
+
+                if m in dist and dist[m] <= d:
+                    continue
+
+                dist[m] = d
+
+                if d == dist[n]:
+                    queue.appendleft(m)
+                else:
+                    queue.append(m)
+
+        return dist.get(end)
+
+    @staticmethod
+    def _max_actions(first, end, succ, cost):
+
+        # longest path in DAG, iterative DFS (0 - not visited, 1 - on stack, 2 - done)
+        state = {}
+        longest = {end: 0}
+        stack = [(first, False)]
+
+        while stack:
+
+            (n, expanded) = stack.pop()
+
+            if n == end:
+                continue
+
+            if expanded:
+
+                state[n] = 2
+                longest[n] = cost[n] + max(longest[m] for m in succ[n])
+                continue
+
+            if state.get(n, 0) == 2:
+                continue
+
+            state[n] = 1
+            stack.append((n, True))
+
+            for m in succ[n]:
+
+                if state.get(m, 0) == 1:
+                    return None  # cycle
+
+                if m != end and state.get(m, 0) == 0:
+                    stack.append((m, False))
+
+        return longest.get(first)
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
 import rospy
+import numpy as np
+import matplotlib.path as mplPath
+from array import array
 from art_msgs.msg import Program,  ProgramItem
 from geometry_msgs.msg import Pose, Polygon
 
@@ -12,31 +15,65 @@ class ProgramHelper():
         The class can load and check Program message. It has no internal state.
         It only helps to find next block/item id after success or failure (without iterating over all blocks/items).
 
+        On load, the program is compiled into flat arrays indexed by item position (in order of blocks and items in the message):
+        successors on success/failure (-1 means end of the program), item types and the first item of each block.
+        Transitions are then just array lookups.
+
+        Learned state of each item is evaluated on load and then kept up to date by update_item, which should be called
+        after each edit of an item (it re-checks only the edited item). Polygons of PICK_FROM_POLYGON items are compiled
+        into matplotlib paths the same way (see get_polygon).
+
     """
 
     def __init__(self):
 
-        self._cache = {}
         self._prog = None
 
+        self._block_ids = []  # block idx -> block id
+        self._block_idx = {}  # block id -> block idx
+        self._block_on_success = []  # block idx -> block id
+        self._block_on_failure = []
+        self._block_first_item = array('i')  # block idx -> flat item idx
+        self._block_items = []  # block idx -> list of item ids
+
+        self._item_idx = {}  # (block id, item id) -> flat item idx
+        self._item_keys = []  # flat item idx -> (block id, item id)
+        self._item_msgs = []  # flat item idx -> ProgramItem
+        self._item_types = array('i')
+        self._on_success = array('i')  # flat item idx -> flat item idx or -1 (end)
+        self._on_failure = array('i')
+        self._item_block_idx = array('i')  # flat item idx -> block idx
+        self._item_paths = []  # flat item idx -> compiled polygon (mplPath.Path) or None
+
+        # learned state as bitmaps (bit n corresponds to flat item idx n)
+        self._requires_learning_mask = 0
+        self._not_learned_mask = 0
+        self._block_masks = []  # block idx -> bits of block items
+
     def load(self, prog,  template=False):
 
         if not isinstance(prog,  Program):
             rospy.logerr("Invalid argument. Should be Program message.")
             return False
 
-        cache = {}
-
         if len(prog.blocks) == 0:
 
             rospy.logerr("Program with zero blocks!")
             return False
 
-        for block_idx in range(0,  len(prog.blocks)):
+        block_ids = []
+        block_idx = {}
+        block_first_item = array('i')
+        block_items = []
+
+        item_idx = {}
+        item_keys = []
+        item_msgs = []
+        item_types = array('i')
 
-            block = prog.blocks[block_idx]
+        for block in prog.blocks:
 
-            if block.id in cache:
+            if block.id in block_idx:
 
                 rospy.logerr("Duplicate block id: " + str(block.id))
                 return False
@@ -46,23 +83,19 @@ class ProgramHelper():
                 rospy.logerr("Invalid block id: " + str(block.id))
                 return False
 
-            cache[block.id] = {}
-
-            cache[block.id]["idx"] = block_idx
-            cache[block.id]["on_success"] = block.on_success
-            cache[block.id]["on_failure"] = block.on_failure
-            cache[block.id]["items"] = {}
-
             if len(block.items) == 0:
 
                 rospy.logerr("Block with zero items!")
                 return False
 
-            for item_idx in range(0,  len(block.items)):
+            block_idx[block.id] = len(block_ids)
+            block_ids.append(block.id)
+            block_first_item.append(len(item_keys))
+            block_items.append([])
 
-                item = block.items[item_idx]
+            for item in block.items:
 
-                if item.id in cache[block.id]["items"]:
+                if (block.id, item.id) in item_idx:
 
                     rospy.logerr("Duplicate item id: " + str(item.id) + " (block id: " + str(block.id) + ")")
                     return False
@@ -72,67 +105,197 @@ class ProgramHelper():
                     rospy.logerr("Invalid item id: " + str(item.id) + " (block id: " + str(block.id) + ")")
                     return False
 
-                cache[block.id]["items"][item.id] = {}
-                cache[block.id]["items"][item.id]["idx"] = item_idx
-                cache[block.id]["items"][item.id]["on_success"] = item.on_success
-                cache[block.id]["items"][item.id]["on_failure"] = item.on_failure
+                item_idx[(block.id, item.id)] = len(item_keys)
+                item_keys.append((block.id, item.id))
+                item_msgs.append(item)
+                item_types.append(item.type)
+                block_items[-1].append(item.id)
 
         # now the cache is done, let's make some simple checks
-        for k,  v in cache.iteritems():
+        for block in prog.blocks:
 
             # 0 means jump to the end
-            if v["on_success"] != 0 and v["on_success"] not in cache:
+            if block.on_success != 0 and block.on_success not in block_idx:
 
-                rospy.logerr("Block id: " + str(k) + " has invalid on_success: " + str(v["on_success"]))
+                rospy.logerr("Block id: " + str(block.id) + " has invalid on_success: " + str(block.on_success))
                 return False
 
-            if v["on_failure"] != 0 and v["on_failure"] not in cache:
+            if block.on_failure != 0 and block.on_failure not in block_idx:
 
-                rospy.logerr("Block id: " + str(k) + " has invalid on_success: " + str(v["on_success"]))
+                rospy.logerr("Block id: " + str(block.id) + " has invalid on_failure: " + str(block.on_failure))
                 return False
 
-            for kk,  vv in v["items"].iteritems():
+            for item in block.items:
 
                 # 0 means jump to the end
-                if vv["on_success"] != 0 and vv["on_success"] not in cache[k]["items"]:
+                if item.on_success != 0 and (block.id, item.on_success) not in item_idx:
 
-                    rospy.logerr("Block id: " + str(k) + ", item id: " + str(kk) + " has invalid on_success: " + str(vv["on_success"]))
+                    rospy.logerr("Block id: " + str(block.id) + ", item id: " + str(item.id) + " has invalid on_success: " + str(item.on_success))
                     return False
 
-                if vv["on_failure"] != 0 and vv["on_failure"] not in cache[k]["items"]:
+                if item.on_failure != 0 and (block.id, item.on_failure) not in item_idx:
 
-                    rospy.logerr("Block id: " + str(k) + ", item id: " + str(kk) + " has invalid on_failure: " + str(vv["on_failure"]))
+                    rospy.logerr("Block id: " + str(block.id) + ", item id: " + str(item.id) + " has invalid on_failure: " + str(item.on_failure))
                     return False
 
-                item = prog.blocks[v["idx"]].items[vv["idx"]]
-
                 for ref in item.ref_id:
 
-                    if ref not in cache[k]["items"]:
+                    if (block.id, ref) not in item_idx:
 
-                        rospy.logerr("Block id: " + str(k) + ", item id: " + str(kk) + " has invalid ref_id: " + str(ref))
+                        rospy.logerr("Block id: " + str(block.id) + ", item id: " + str(item.id) + " has invalid ref_id: " + str(ref))
                         return False
 
                 if item.type in [ProgramItem.PLACE_TO_POSE] and len(item.ref_id) == 0:
 
-                    rospy.logerr("Block id: " + str(k) + ", item id: " + str(kk) + " has NO ref_id!")
+                    rospy.logerr("Block id: " + str(block.id) + ", item id: " + str(item.id) + " has NO ref_id!")
                     return False
 
-                if template:
+        # compile transition table
+        on_success = array('i')
+        on_failure = array('i')
+
+        for block in prog.blocks:
+
+            for item in block.items:
+
+                on_success.append(self._compile_transition(block, item.on_success, block.on_success, item_idx, block_idx, block_first_item))
+                on_failure.append(self._compile_transition(block, item.on_failure, block.on_failure, item_idx, block_idx, block_first_item))
+
+        if template:
 
-                    item.object = []
+            for item in item_msgs:
 
-                    # for stamped types we want to keep header (frame_id)
-                    for polygon in item.polygon:
-                        polygon.polygon = Polygon()
+                item.object = []
 
-                    for pose in item.pose:
-                        pose.pose = Pose()
+                # for stamped types we want to keep header (frame_id)
+                for polygon in item.polygon:
+                    polygon.polygon = Polygon()
+
+                for pose in item.pose:
+                    pose.pose = Pose()
 
         self._prog = prog
-        self._cache = cache
+
+        self._block_ids = block_ids
+        self._block_idx = block_idx
+        self._block_on_success = [block.on_success for block in prog.blocks]
+        self._block_on_failure = [block.on_failure for block in prog.blocks]
+        self._block_first_item = block_first_item
+        self._block_items = block_items
+
+        self._item_idx = item_idx
+        self._item_keys = item_keys
+        self._item_msgs = item_msgs
+        self._item_types = item_types
+        self._on_success = on_success
+        self._on_failure = on_failure
+        self._item_block_idx = array('i', [block_idx[key[0]] for key in item_keys])
+        self._item_paths = [self._compile_polygon(item) for item in item_msgs]
+
+        self._requires_learning_mask = 0
+        self._not_learned_mask = 0
+        self._block_masks = [((1 << len(block_items[i])) - 1) << block_first_item[i] for i in range(0, len(block_ids))]
+
+        for idx in range(0, len(item_keys)):
+            self._set_learned(idx, self._check_item_learned(*item_keys[idx]))
+
         return True
 
+    def update_item(self, block_id, item_id, msg):
+        """Replaces item message (msg can be also the same, already edited, instance).
+
+        Only references of the edited item are checked. Returns False (and keeps the old message) if the item is invalid.
+        """
+
+        if (block_id, item_id) not in self._item_idx:
+
+            rospy.logerr("Block id: " + str(block_id) + ", item id: " + str(item_id) + " does not exist")
+            return False
+
+        if msg.id != item_id:
+
+            rospy.logerr("Block id: " + str(block_id) + ", item id: " + str(item_id) + " can't be changed to id: " + str(msg.id))
+            return False
+
+        if msg.on_success != 0 and (block_id, msg.on_success) not in self._item_idx:
+
+            rospy.logerr("Block id: " + str(block_id) + ", item id: " + str(item_id) + " has invalid on_success: " + str(msg.on_success))
+            return False
+
+        if msg.on_failure != 0 and (block_id, msg.on_failure) not in self._item_idx:
+
+            rospy.logerr("Block id: " + str(block_id) + ", item id: " + str(item_id) + " has invalid on_failure: " + str(msg.on_failure))
+            return False
+
+        for ref in msg.ref_id:
+
+            if (block_id, ref) not in self._item_idx:
+
+                rospy.logerr("Block id: " + str(block_id) + ", item id: " + str(item_id) + " has invalid ref_id: " + str(ref))
+                return False
+
+        if msg.type in [ProgramItem.PLACE_TO_POSE] and len(msg.ref_id) == 0:
+
+            rospy.logerr("Block id: " + str(block_id) + ", item id: " + str(item_id) + " has NO ref_id!")
+            return False
+
+        idx = self._item_idx[(block_id, item_id)]
+        block_idx = self._item_block_idx[idx]
+        block = self._prog.blocks[block_idx]
+
+        block.items[idx - self._block_first_item[block_idx]] = msg
+        self._item_msgs[idx] = msg
+        self._item_types[idx] = msg.type
+
+        self._on_success[idx] = self._compile_transition(block, msg.on_success, block.on_success, self._item_idx, self._block_idx, self._block_first_item)
+        self._on_failure[idx] = self._compile_transition(block, msg.on_failure, block.on_failure, self._item_idx, self._block_idx, self._block_first_item)
+        self._item_paths[idx] = self._compile_polygon(msg)
+
+        self._set_learned(idx, self._check_item_learned(block_id, item_id))
+
+        return True
+
+    def _set_learned(self, idx, learned):
+
+        bit = 1 << idx
+
+        if learned is None:
+            self._requires_learning_mask &= ~bit
+        else:
+            self._requires_learning_mask |= bit
+
+        if learned is False:
+            self._not_learned_mask |= bit
+        else:
+            self._not_learned_mask &= ~bit
+
+    @staticmethod
+    def _compile_transition(block, item_id_on, block_id_on, item_idx, block_idx, block_first_item):
+
+        # TODO make constant in msg for it
+        if item_id_on != 0:
+            return item_idx[(block.id, item_id_on)]
+
+        if block_id_on == 0:
+            return -1  # end of program
+
+        return block_first_item[block_idx[block_id_on]]
+
+    @staticmethod
+    def _compile_polygon(item):
+
+        if item.type != ProgramItem.PICK_FROM_POLYGON or len(item.polygon) == 0:
+            return None
+
+        points = [[pt.x, pt.y] for pt in item.polygon[0].polygon.points]
+
+        if len(points) < 3:
+            return None
+
+        # last vertex of closed path is ignored, so the first one has to be repeated
+        points.append(points[0])
+        return mplPath.Path(np.array(points), closed=True)
+
     def get_program(self):
 
         return self._prog
@@ -143,78 +306,66 @@ class ProgramHelper():
 
     def get_block_msg(self,  block_id):
 
-        block_idx = self._cache[block_id]["idx"]
-        return self._prog.blocks[block_idx]
+        return self._prog.blocks[self._block_idx[block_id]]
 
     def get_block_ids(self):
 
-        return self._cache.keys()
+        return list(self._block_ids)
 
     def get_items_ids(self, block_id):
 
-        return self._cache[block_id]["items"].keys()
+        return list(self._block_items[self._block_idx[block_id]])
 
     def get_first_block_id(self):
 
-        return min(self._cache,  key=self._cache.get)
+        return self._block_ids[0]
 
     def get_first_item_id(self, block_id=None):
 
         if block_id is None:
-            block_id = self.get_first_block_id()
-        items = self._cache[block_id]["items"]
-        item_id = min(items,  key=items.get)
-        return (block_id,  item_id)
-
-    def get_item_msg(self,  block_id,  item_id):
-
-        block_idx = self._cache[block_id]["idx"]
-        item_idx = self._cache[block_id]["items"][item_id]["idx"]
-        return self._prog.blocks[block_idx].items[item_idx]
-
-    def _get_block_on(self,  block_id, what):
-
-        return self._cache[block_id][what]
+            block_idx = 0
+        else:
+            block_idx = self._block_idx[block_id]
 
-    def _get_item_on(self,  block_id,  item_id,  what):
+        return self._item_keys[self._block_first_item[block_idx]]
 
-        item_id_on = self._cache[block_id]["items"][item_id][what]
+    def get_item_msg(self,  block_id,  item_id):
 
-        # TODO make constant in msg for it
-        if item_id_on == 0:
+        return self._item_msgs[self._item_idx[(block_id, item_id)]]
 
-            next_block_id = self. _get_block_on(block_id, what)
+    def get_polygon(self, block_id, item_id):
+        """Returns compiled polygon (matplotlib Path) of PICK_FROM_POLYGON item or None if it is not set."""
 
-            if next_block_id == 0:
+        return self._item_paths[self._item_idx[(block_id, item_id)]]
 
-                return (0,  0)  # end of program
+    def _get_item_on(self, table, block_id, item_id):
 
-            return self.get_first_item_id(next_block_id)
+        idx = table[self._item_idx[(block_id, item_id)]]
 
-        else:
+        if idx < 0:
+            return (0,  0)  # end of program
 
-            return (block_id, item_id_on)
+        return self._item_keys[idx]
 
     def get_id_on_success(self,  block_id,  item_id):
 
-        return self._get_item_on(block_id,  item_id,  "on_success")
+        return self._get_item_on(self._on_success, block_id,  item_id)
 
     def get_id_on_failure(self,  block_id,  item_id):
 
-        return self._get_item_on(block_id,  item_id,  "on_failure")
+        return self._get_item_on(self._on_failure, block_id,  item_id)
 
     def get_block_on_success(self,  block_id):
 
-        return self._get_block_on(block_id, "on_success")
+        return self._block_on_success[self._block_idx[block_id]]
 
     def get_block_on_failure(self,  block_id):
 
-        return self._get_block_on(block_id, "on_failure")
+        return self._block_on_failure[self._block_idx[block_id]]
 
     def get_item_type(self, block_id, item_id):
 
-        msg = self.get_item_msg(block_id, item_id)
-        return msg.type
+        return self._item_types[self._item_idx[(block_id, item_id)]]
 
     def item_requires_learning(self, block_id, item_id):
 
@@ -276,59 +427,61 @@ class ProgramHelper():
 
     def program_learned(self):
 
-        blocks = self.get_block_ids()
-
-        for block_id in blocks:
-
-            if not self.block_learned(block_id):
-                return False
-
-        return True
+        return self._not_learned_mask == 0
 
     def block_learned(self, block_id):
 
-        items = self.get_items_ids(block_id)
+        return self._not_learned_mask & self._block_masks[self._block_idx[block_id]] == 0
+
+    def item_learned(self, block_id, item_id):
 
-        for item_id in items:
+        bit = 1 << self._item_idx[(block_id, item_id)]
 
-            if self.item_learned(block_id, item_id) is False:
-                return False
+        if not self._requires_learning_mask & bit:
+            return None
 
-        return True
+        return not self._not_learned_mask & bit
 
-    def item_learned(self, block_id, item_id):
+    def _check_item_learned(self, block_id, item_id):
 
         if not self.item_requires_learning(block_id,  item_id):
             return None
 
         msg = self.get_item_msg(block_id, item_id)
 
-        if msg.type == ProgramItem.PICK_FROM_POLYGON:
+        try:
 
-            if not (self.is_object_set(block_id, item_id) and self.is_polygon_set(block_id, item_id)):
-                return False
-            else:
-                return True
+            if msg.type == ProgramItem.PICK_FROM_POLYGON:
 
-        elif msg.type in [ProgramItem.PICK_FROM_FEEDER]:
+                if not (self.is_object_set(block_id, item_id) and self.is_polygon_set(block_id, item_id)):
+                    return False
+                else:
+                    return True
 
-            if not (self.is_object_set(block_id, item_id) and self.is_pose_set(block_id, item_id)):
-                return False
-            else:
-                return True
+            elif msg.type in [ProgramItem.PICK_FROM_FEEDER]:
 
-        elif msg.type in [ProgramItem.PLACE_TO_POSE]:
+                if not (self.is_object_set(block_id, item_id) and self.is_pose_set(block_id, item_id)):
+                    return False
+                else:
+                    return True
 
-            if not self.is_pose_set(block_id, item_id):
-                return False
-            else:
-                return True
+            elif msg.type in [ProgramItem.PLACE_TO_POSE]:
 
-        elif msg.type == ProgramItem.PICK_OBJECT_ID:
+                if not self.is_pose_set(block_id, item_id):
+                    return False
+                else:
+                    return True
 
-            if not (self.is_object_set(block_id, item_id)):
-                return False
-            else:
-                return True
+            elif msg.type == ProgramItem.PICK_OBJECT_ID:
+
+                if not (self.is_object_set(block_id, item_id)):
+                    return False
+                else:
+                    return True
+
+        except ValueError:
+
+            # e.g. empty 'pose' array - such item can't be learned
+            return False
 
         raise NotImplementedError("Not yet supported item type.")
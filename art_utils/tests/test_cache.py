@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import rospy
+import unittest
+import rostest
+from art_utils import ArtCache
+import sys
+import time
+
+
+class TestArtCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.cache = ArtCache(3)
+
+    def test_get_put(self):
+
+        self.assertEquals(self.cache.get("a"), None, "get_put - empty")
+        self.cache.put("a", 1)
+        self.assertEquals(self.cache.get("a"), 1, "get_put - value")
+
+        stats = self.cache.get_stats()
+        self.assertEquals(stats["hits"], 1, "get_put - hits")
+        self.assertEquals(stats["misses"], 1, "get_put - misses")
+
+    def test_get_default(self):
+
+        self.cache.put("a", None)
+        self.assertEquals(self.cache.get("a", False), None, "get_default - stored None")
+        self.assertEquals(self.cache.get("b", False), False, "get_default - missing")
+
+    def test_lru_eviction(self):
+
+        for k in ["a", "b", "c"]:
+            self.cache.put(k, k)
+
+        self.cache.get("a")  # "b" is now the least recently used
+        self.cache.put("d", "d")
+
+        self.assertEquals(len(self.cache), 3, "lru_eviction - size")
+        self.assertEquals("b" in self.cache, False, "lru_eviction - evicted")
+        self.assertEquals("a" in self.cache, True, "lru_eviction - kept")
+        self.assertEquals(self.cache.get_stats()["evictions"], 1, "lru_eviction - evictions")
+
+    def test_invalidate(self):
+
+        self.cache.put("a", 1)
+        self.cache.invalidate("a")
+        self.assertEquals(self.cache.get("a"), None, "invalidate")
+
+    def test_version(self):
+
+        ver = self.cache.version("a")
+
+        # somebody stores newer value while we are reading from db
+        self.cache.put("a", 2)
+
+        self.assertEquals(self.cache.put("a", 1, ver), False, "version - stale put")
+        self.assertEquals(self.cache.get("a"), 2, "version - value")
+
+        ver = self.cache.version("a")
+        self.assertEquals(self.cache.put("a", 3, ver), True, "version - put")
+        self.assertEquals(self.cache.get("a"), 3, "version - new value")
+
+    def test_ttl(self):
+
+        cache = ArtCache(3, ttl=0.1)
+        cache.put("a", 1)
+        cache.put("b", 2, ttl=10.0)
+        self.assertEquals(cache.get("a"), 1, "ttl - before expiration")
+
+        time.sleep(0.2)
+
+        self.assertEquals(cache.get("a"), None, "ttl - expired")
+        self.assertEquals(cache.get("b"), 2, "ttl - per entry ttl")
+        self.assertEquals(cache.get_stats()["expirations"], 1, "ttl - expirations")
+
+if __name__ == '__main__':
+
+    rospy.init_node('test_node')
+    rostest.run('art_utils', 'test_cache', TestArtCache, sys.argv)
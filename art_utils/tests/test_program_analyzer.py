@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import rospy
+import unittest
+import rostest
+from art_utils import ProgramAnalyzer
+from art_msgs.msg import Program,  ProgramBlock,  ProgramItem
+import sys
+from copy import deepcopy
+from geometry_msgs.msg import PoseStamped
+
+
+class TestProgramAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+
+        self.prog = Program()
+        self.pa = ProgramAnalyzer()
+
+        self.prog.header.id = 666
+        self.prog.header.name = "Pick&place"
+
+        pb = ProgramBlock()
+        pb.id = 1
+        pb.name = "First block"
+        pb.on_success = 0
+        pb.on_failure = 0
+        self.prog.blocks.append(pb)
+
+        p = ProgramItem()
+        p.id = 1
+        p.on_success = 2
+        p.on_failure = 0
+        p.type = ProgramItem.GET_READY
+        pb.items.append(deepcopy(p))
+
+        p = ProgramItem()
+        p.id = 2
+        p.on_success = 3
+        p.on_failure = 0
+        p.type = ProgramItem.WAIT_FOR_USER
+        pb.items.append(deepcopy(p))
+
+        p = ProgramItem()
+        p.id = 3
+        p.on_success = 4
+        p.on_failure = 0
+        p.type = ProgramItem.PICK_FROM_FEEDER
+        p.object.append("profile")
+        pf = PoseStamped()
+        pf.header.frame_id = "marker"
+        pf.pose.position.x = 0.75
+        p.pose.append(pf)
+        pb.items.append(deepcopy(p))
+
+        p = ProgramItem()
+        p.id = 4
+        p.on_success = 2
+        p.on_failure = 0
+        p.type = ProgramItem.PLACE_TO_POSE
+        p.ref_id.append(3)
+        pp = PoseStamped()
+        pp.header.frame_id = "marker"
+        pp.pose.position.x = 0.75
+        p.pose.append(pp)
+        pb.items.append(deepcopy(p))
+
+    def test_valid_program(self):
+
+        res = self.pa.analyze(self.prog)
+        self.assertEquals(res, True, "valid program")
+        self.assertEquals(len(self.pa.warnings), 0, "valid program - warnings")
+        self.assertEquals(self.pa.success_path, [(1, 1), (1, 2), (1, 3), (1, 4)], "valid program - success path")
+        self.assertEquals(self.pa.success_path_loops, True, "valid program - success path loops")
+        self.assertEquals(self.pa.success_path_actions, 3, "valid program - success path actions")
+        self.assertEquals(self.pa.min_actions, 1, "valid program - min actions")
+        self.assertEquals(self.pa.max_actions, None, "valid program - max actions (cycle)")
+
+    def test_infinite_loop(self):
+
+        prog = deepcopy(self.prog)
+        for item in prog.blocks[0].items[1:]:
+            item.on_failure = 2
+
+        res = self.pa.analyze(prog)
+        self.assertEquals(res, False, "infinite loop")
+        self.assertEquals(self.pa.loop_items, [(1, 2), (1, 3), (1, 4)], "infinite loop - items")
+        self.assertEquals(self.pa.min_actions, 1, "infinite loop - min actions (failure of the first item)")
+
+    def test_unreachable(self):
+
+        prog = deepcopy(self.prog)
+        prog.blocks[0].items[3].on_success = 0
+
+        pb = ProgramBlock()
+        pb.id = 2
+        pb.name = "Dead block"
+        pb.on_success = 0
+        pb.on_failure = 0
+        prog.blocks.append(pb)
+
+        p = ProgramItem()
+        p.id = 1
+        p.on_success = 0
+        p.on_failure = 0
+        p.type = ProgramItem.GET_READY
+        pb.items.append(p)
+
+        res = self.pa.analyze(prog)
+        self.assertEquals(res, True, "unreachable")
+        self.assertEquals(self.pa.unreachable_blocks, [2], "unreachable - blocks")
+        self.assertEquals(self.pa.unreachable_items, [(2, 1)], "unreachable - items")
+        self.assertEquals(self.pa.max_actions, 3, "unreachable - max actions")
+
+    def test_place_before_pick(self):
+
+        prog = deepcopy(self.prog)
+        items = prog.blocks[0].items
+        items[1].on_success = 4  # wait -> place
+        items[3].on_success = 3  # place -> pick
+        items[2].on_success = 0
+
+        res = self.pa.analyze(prog)
+        self.assertEquals(res, False, "place before pick")
+
+    def test_place_ref_not_pick(self):
+
+        prog = deepcopy(self.prog)
+        prog.blocks[0].items[3].ref_id = [2]
+
+        res = self.pa.analyze(prog)
+        self.assertEquals(res, False, "place references non-pick")
+
+    def test_invalid_program(self):
+
+        res = self.pa.analyze(Program())
+        self.assertEquals(res, False, "invalid program")
+
+if __name__ == '__main__':
+
+    rospy.init_node('test_node')
+    rostest.run('art_utils', 'test_program_analyzer', TestProgramAnalyzer, sys.argv)
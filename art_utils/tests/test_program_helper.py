@@ -188,6 +188,35 @@ class TestProgramHelper(unittest.TestCase):
         self.assertEquals(block_id, 0, "on_failure - block_id")
         self.assertEquals(item_id, 0, "on_failure - item_id")
 
+    def test_block_transitions(self):
+
+        prog = deepcopy(self.prog)
+        prog.blocks[0].on_success = 2
+        prog.blocks[0].items[-1].on_success = 0
+
+        pb = ProgramBlock()
+        pb.id = 2
+        pb.name = "Second block"
+        pb.on_success = 0
+        pb.on_failure = 1
+        prog.blocks.append(pb)
+
+        p = ProgramItem()
+        p.id = 5
+        p.on_success = 0
+        p.on_failure = 0
+        p.type = ProgramItem.GET_READY
+        pb.items.append(deepcopy(p))
+
+        res = self.ph.load(prog)
+        self.assertEquals(res, True, "block_transitions")
+
+        self.assertEquals(self.ph.get_id_on_success(1, 9), (2, 5), "block_transitions - next block")
+        self.assertEquals(self.ph.get_id_on_success(2, 5), (0, 0), "block_transitions - end")
+        self.assertEquals(self.ph.get_id_on_failure(2, 5), (1, 1), "block_transitions - on_failure block")
+        self.assertEquals(self.ph.get_block_on_success(1), 2, "block_transitions - block on_success")
+        self.assertEquals(self.ph.get_item_type(2, 5), ProgramItem.GET_READY, "block_transitions - item type")
+
     def test_get_item_msg(self):
 
         res = self.ph.load(self.prog)
@@ -238,6 +267,83 @@ class TestProgramHelper(unittest.TestCase):
         self.ph.load(self.prog, True)
         self.assertEquals(self.ph.program_learned(), False, "test_template")
 
+    def test_update_item(self):
+
+        self.ph.load(self.prog, True)
+        self.assertEquals(self.ph.item_learned(1, 4), False, "update_item - template")
+
+        msg = self.ph.get_item_msg(1, 4)
+        msg.pose[0].pose.position.x = 0.5
+
+        res = self.ph.update_item(1, 4, msg)
+        self.assertEquals(res, True, "update_item")
+        self.assertEquals(self.ph.item_learned(1, 4), True, "update_item - item learned")
+        self.assertEquals(self.ph.item_learned(1, 9), False, "update_item - other item")
+        self.assertEquals(self.ph.program_learned(), False, "update_item - program learned")
+
+        msg = deepcopy(self.ph.get_item_msg(1, 2))
+        msg.on_success = 7
+        res = self.ph.update_item(1, 2, msg)
+        self.assertEquals(res, True, "update_item - on_success")
+        self.assertEquals(self.ph.get_id_on_success(1, 2), (1, 7), "update_item - on_success")
+
+    def test_learned(self):
+
+        self.ph.load(self.prog, True)
+        self.assertEquals(self.ph.item_learned(1, 1), None, "learned - not required")
+        self.assertEquals(self.ph.item_learned(1, 3), False, "learned - template item")
+        self.assertEquals(self.ph.block_learned(1), False, "learned - block")
+
+        for item_id in (3, 4, 5, 8, 9):
+
+            msg = self.ph.get_item_msg(1, item_id)
+
+            if msg.type != ProgramItem.PLACE_TO_POSE:
+                msg.object = ["profile"]
+            if len(msg.pose) > 0:
+                msg.pose[0].pose.position.x = 0.5
+            if len(msg.polygon) > 0:
+                msg.polygon[0].polygon.points.append(Point32(0.4, 0.1, 0))
+
+            self.ph.update_item(1, item_id, msg)
+
+        self.assertEquals(self.ph.block_learned(1), True, "learned - block done")
+        self.assertEquals(self.ph.program_learned(), True, "learned - program done")
+
+    def test_get_polygon(self):
+
+        self.ph.load(self.prog)
+
+        pol = self.ph.get_polygon(1, 8)
+        self.assertEquals(pol.contains_point([0.7, 0.3]), True, "get_polygon - inside")
+        self.assertEquals(pol.contains_point([0.1, 0.1]), False, "get_polygon - outside")
+        self.assertEquals(list(pol.contains_points([[0.7, 0.3], [1.1, 0.3]])), [True, False], "get_polygon - batch")
+        self.assertEquals(self.ph.get_polygon(1, 3), None, "get_polygon - not polygon item")
+
+        self.ph.load(self.prog, True)
+        self.assertEquals(self.ph.get_polygon(1, 8), None, "get_polygon - template")
+
+        msg = self.ph.get_item_msg(1, 8)
+        for (x, y) in ((0.4, 0.1), (1.0, 0.1), (1.0, 0.6), (0.4, 0.6)):
+            msg.polygon[0].polygon.points.append(Point32(x, y, 0))
+        self.ph.update_item(1, 8, msg)
+        self.assertEquals(self.ph.get_polygon(1, 8).contains_point([0.7, 0.3]), True, "get_polygon - update_item")
+
+    def test_update_item_invalid(self):
+
+        self.ph.load(self.prog)
+
+        msg = deepcopy(self.ph.get_item_msg(1, 4))
+        msg.ref_id = [1234]
+        res = self.ph.update_item(1, 4, msg)
+        self.assertEquals(res, False, "update_item_invalid - ref_id")
+        self.assertEquals(self.ph.get_item_msg(1, 4).ref_id, [3, 5], "update_item_invalid - old msg kept")
+
+        msg = deepcopy(self.ph.get_item_msg(1, 2))
+        msg.on_failure = 1234
+        res = self.ph.update_item(1, 2, msg)
+        self.assertEquals(res, False, "update_item_invalid - on_failure")
+
     def test_invalid_ref_id(self):
 
         prog = deepcopy(self.prog)